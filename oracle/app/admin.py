@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Keystore, Proposal
+from .models import AddressHolding, Keystore, OraclizeFeed, Proposal
 
 
 @admin.register(Keystore)
@@ -11,3 +11,14 @@ class KeystoreAdmin(admin.ModelAdmin):
 @admin.register(Proposal)
 class ProposalAdmin(admin.ModelAdmin):
     list_display = ('is_state_multisig', 'public_key', 'multisig_address')
+
+
+@admin.register(AddressHolding)
+class AddressHoldingAdmin(admin.ModelAdmin):
+    list_display = ('evm_address', 'multisig_address', 'balance')
+
+
+@admin.register(OraclizeFeed)
+class OraclizeFeedAdmin(admin.ModelAdmin):
+    list_display = ('multisig_address', 'oraclize_contract', 'source', 'interval', 'threshold', 'debounce',
+                    'enabled', 'last_value', 'last_pushed_at', 'last_error')
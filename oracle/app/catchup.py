@@ -0,0 +1,84 @@
+"""
+Catch up the state files with the txs notified while the oracle was down.
+
+OSS lists the txs of an address newest first, `PAGE_SIZE` per page. The
+pages are walked until the last tx recorded in the StateTransaction ledger,
+and the txs found are replayed oldest first through the state synchroniser,
+which checkpoints every tx: an interrupted catch-up resumes where it
+stopped.
+"""
+import time
+
+from app import utxos as utxo_utils
+from app.evm_pool import run_for_state
+from app.state_cache import state_cache
+from app.state_sync import is_applied, last_applied_tx, replay_txs
+from gcoinbackend import core as gcoincore
+
+PAGE_SIZE = 200
+
+
+def tx_hash_of(tx):
+    return tx.get('txid') or tx['hash']
+
+
+def iter_address_txs(multisig_address):
+    """
+    Yield the tx hashes of `multisig_address`, newest first.
+    """
+    starting_after = None
+    while True:
+        txs = gcoincore.get_txs_by_address(multisig_address, starting_after=starting_after)['txs']
+        for tx in txs:
+            yield tx_hash_of(tx)
+        if len(txs) < PAGE_SIZE:
+            return
+        starting_after = tx_hash_of(txs[-1])
+
+
+def missing_txs(multisig_address):
+    """
+    Return the txs of `multisig_address` newer than the last applied one,
+    oldest first.
+    """
+    last_tx = last_applied_tx(multisig_address)
+    missing = []
+    for tx_hash in iter_address_txs(multisig_address):
+        if tx_hash == last_tx or (last_tx and is_applied(multisig_address, tx_hash)):
+            break
+        missing.append(tx_hash)
+    missing.reverse()
+    return missing
+
+
+def txs_until(multisig_address, tx_hash):
+    """
+    Return the unapplied txs of `multisig_address` up to `tx_hash`, oldest
+    first: replaying the state to `tx_hash` applies all of them.
+    """
+    missing = missing_txs(multisig_address)
+    if tx_hash not in missing:
+        # not listed by OSS yet
+        return [tx_hash]
+    return missing[:missing.index(tx_hash) + 1]
+
+
+def catch_up(multisig_address):
+    """
+    Apply the missing txs of `multisig_address` and return how many there were.
+    """
+    tx_hashes = missing_txs(multisig_address)
+    if not tx_hashes:
+        return 0
+    completed = run_for_state(multisig_address, replay_txs, multisig_address, tx_hashes)
+    state_cache.invalidate(multisig_address)
+    if not completed:
+        raise ValueError('Replay of {} stopped before its last tx'.format(multisig_address))
+    # the utxo set missed the same notifications
+    utxo_utils.reconcile(multisig_address)
+    return len(tx_hashes)
+
+
+def timed_catch_up(multisig_address):
+    started = time.time()
+    return catch_up(multisig_address), time.time() - started
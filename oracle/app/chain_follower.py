@@ -0,0 +1,128 @@
+"""
+Block-driven ingestion, an alternative to the OSS address webhooks.
+
+`ChainFollower` follows the chain from a cursor persisted in the
+ChainCursor table, block by block through `nextblockhash`. The txs of a
+block are fetched concurrently and matched against the set of registered
+multisig addresses, on their outputs and on the local utxos they spend.
+Matching txs are queued like address notifications, so the deduplication
+of the webhooks applies, and the cursor moves after every block: a
+restarted follower continues after the last queued block.
+"""
+from app import utxos as utxo_utils
+from app.dispatcher import QueueFull
+from app.models import ChainCursor, NotificationJob, Proposal, StateUtxo
+from app.views import queue_notification
+from gcoinbackend import core as gcoincore
+
+
+def tip_block():
+    return max(gcoincore.get_latest_blocks(), key=lambda block: block['height'])
+
+
+def block_txs(block):
+    """
+    Return the txs of `block`, fetching the ones only listed by hash.
+    """
+    entries = block.get('tx', [])
+    txids = [entry for entry in entries if not hasattr(entry, 'get')]
+    fetched = dict(zip(txids, utxo_utils.get_executor().map(gcoincore.get_tx, txids)))
+    return [entry if hasattr(entry, 'get') else fetched[entry] for entry in entries]
+
+
+def match_txs(txs, addresses):
+    """
+    Return the (multisig_address, tx_hash) pairs of `txs` touching `addresses`.
+    """
+    spent = {}
+    txids = set(vin['txid'] for tx in txs for vin in tx.get('vin', []) if 'txid' in vin)
+    if txids:
+        for utxo in StateUtxo.objects.filter(txid__in=txids):
+            spent[utxo.as_outpoint()] = utxo.multisig_address
+
+    matches = []
+    for tx in txs:
+        matched = set()
+        for vout in tx.get('vout', []):
+            matched.update(address for address in vout.get('scriptPubKey', {}).get('addresses', [])
+                           if address in addresses)
+        for vin in tx.get('vin', []):
+            if 'txid' in vin and (vin['txid'], vin['vout']) in spent:
+                matched.add(spent[(vin['txid'], vin['vout'])])
+        matches.extend((address, tx['txid']) for address in sorted(matched))
+    return matches
+
+
+class ChainFollower(object):
+
+    def __init__(self, name='default'):
+        self.name = name
+        self.blocks = 0
+        self.txs = 0
+        self.queued = 0
+
+    def get_cursor(self):
+        return ChainCursor.objects.filter(name=self.name).first()
+
+    def save_cursor(self, block):
+        cursor, _ = ChainCursor.objects.update_or_create(
+            name=self.name, defaults={'block_hash': block['hash'], 'height': block['height']})
+        return cursor
+
+    def next_block(self, cursor):
+        """
+        Return the block after `cursor`, or None at the tip.
+        """
+        block = gcoincore.get_block_by_hash(cursor.block_hash)
+        if block.get('nextblockhash'):
+            return gcoincore.get_block_by_hash(block['nextblockhash'])
+
+        if tip_block()['height'] > cursor.height:
+            # the cursor block left the main chain, queued txs are deduplicated
+            print('Block {} was orphaned, step back'.format(cursor.block_hash))
+            return gcoincore.get_block_by_hash(block['previousblockhash'])
+        return None
+
+    def follow(self, max_blocks=None):
+        """
+        Process the blocks after the cursor up to the tip, or `max_blocks`
+        of them, and return how many were processed.
+
+        Raises QueueFull when the notification queue rejects a tx; the
+        cursor stays before that block.
+        """
+        cursor = self.get_cursor()
+        if cursor is None:
+            # older blocks are the job of `catchup_states`
+            self.save_cursor(tip_block())
+            return 0
+
+        addresses = set(Proposal.objects.exclude(multisig_address='').values_list('multisig_address', flat=True))
+        processed = 0
+        while max_blocks is None or processed < max_blocks:
+            block = self.next_block(cursor)
+            if block is None:
+                break
+            self.process_block(block, addresses)
+            cursor = self.save_cursor(block)
+            processed += 1
+        return processed
+
+    def process_block(self, block, addresses):
+        txs = block_txs(block)
+        for multisig_address, tx_hash in match_txs(txs, addresses):
+            if queue_notification(NotificationJob.KIND_ADDRESS, tx_hash, multisig_address):
+                raise QueueFull('Cannot queue {} of block {}'.format(tx_hash, block['hash']))
+            self.queued += 1
+        self.blocks += 1
+        self.txs += len(txs)
+
+
+def start_at(name, block_hash):
+    """
+    Move the cursor of follower `name` to `block_hash`; the blocks after it
+    are processed next.
+    """
+    block = gcoincore.get_block_header(block_hash)
+    ChainCursor.objects.update_or_create(
+        name=name, defaults={'block_hash': block['hash'], 'height': block['height']})
@@ -0,0 +1,202 @@
+"""
+Bounded executor for notification processing.
+
+Webhooks used to start one thread per notification, so a burst created an
+unbounded number of threads racing on the same state files. The dispatcher
+runs jobs on a fixed number of worker threads and keeps one serial queue per
+key (the multisig address): jobs of the same state run one at a time in
+arrival order, jobs of different states run in parallel. Jobs queued with
+`coalesce` are merged with the job of the same function waiting last in the
+queue of their key, so a backlog of one state is processed as one job.
+"""
+import atexit
+import collections
+import threading
+import time
+
+from django.conf import settings
+
+
+class QueueFull(Exception):
+    pass
+
+
+_Job = collections.namedtuple('_Job', ['fn', 'args', 'queued_at', 'items'])
+
+
+class Dispatcher(object):
+
+    def __init__(self, workers, max_queued):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.queued = 0
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.run_time = 0.0
+        self.max_run_time = 0.0
+        self._queues = {}
+        # keys with queued jobs and no job running, in the order they became ready
+        self._ready = collections.deque()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads = []
+        for _ in range(workers):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Queue `fn(*args)` behind the other jobs of `key`.
+
+        Raises QueueFull when `max_queued` jobs are waiting, unless
+        `bounded=False`, which is meant for follow-up jobs of accepted work.
+        """
+        bounded = kwargs.pop('bounded', True)
+        self._queue(key, _Job(fn, args, time.time(), None), bounded)
+
+    def coalesce(self, key, fn, item, bounded=True):
+        """
+        Queue `fn(key, items)`, or add `item` to the items of the `fn` job
+        already waiting last in the queue of `key`.
+        """
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue and queue[-1].fn is fn and queue[-1].items is not None:
+                queue[-1].items.append(item)
+                self.coalesced += 1
+                return
+        items = [item]
+        self._queue(key, _Job(fn, (key, items), time.time(), items), bounded)
+
+    def _queue(self, key, job, bounded):
+        if not self.workers:
+            # no worker threads: run the job in the calling thread
+            with self._lock:
+                if self._closed:
+                    raise QueueFull('Dispatcher is shut down')
+                self.running += 1
+            self._run(job)
+            return
+
+        with self._lock:
+            if self._closed:
+                raise QueueFull('Dispatcher is shut down')
+            if bounded and self.queued >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull('{} jobs queued'.format(self.queued))
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = collections.deque()
+                self._ready.append(key)
+            queue.append(job)
+            self.queued += 1
+            self._changed.notify_all()
+
+    def drain(self, timeout=None):
+        """
+        Stop accepting jobs and wait for the queued ones to finish.
+        Returns False when jobs were still pending after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            self._closed = True
+            while self.queued or self.running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            self._changed.notify_all()
+        return True
+
+    def stats(self):
+        with self._lock:
+            finished = self.processed + self.failed
+            return {
+                'workers': self.workers,
+                'queue_depth': self.queued,
+                'queue_limit': self.max_queued,
+                'running': self.running,
+                'keys': len(self._queues),
+                'processed': self.processed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'coalesced': self.coalesced,
+                'avg_wait_time': self.wait_time / finished if finished else 0.0,
+                'max_wait_time': self.max_wait_time,
+                'avg_run_time': self.run_time / finished if finished else 0.0,
+                'max_run_time': self.max_run_time,
+            }
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._ready:
+                    if self._closed and not self.queued:
+                        return
+                    self._changed.wait()
+                key = self._ready.popleft()
+                job = self._queues[key].popleft()
+                self.queued -= 1
+                self.running += 1
+
+            self._run(job)
+
+            with self._lock:
+                if self._queues[key]:
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                self._changed.notify_all()
+
+    def _run(self, job):
+        started = time.time()
+        try:
+            job.fn(*job.args)
+            succeeded = True
+        except Exception as e:
+            print('Notification job failed: ' + str(e))
+            succeeded = False
+        finished = time.time()
+
+        with self._lock:
+            self.running -= 1
+            if succeeded:
+                self.processed += 1
+            else:
+                self.failed += 1
+            self.wait_time += started - job.queued_at
+            self.max_wait_time = max(self.max_wait_time, started - job.queued_at)
+            self.run_time += finished - started
+            self.max_run_time = max(self.max_run_time, finished - started)
+            self._changed.notify_all()
+
+
+_dispatcher = None
+_inline_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """
+    Return the process-wide Dispatcher, or one running the jobs in the
+    calling thread with `RUN_BACKGROUND_TASKS_INLINE`.
+    """
+    global _dispatcher, _inline_dispatcher
+    with _dispatcher_lock:
+        if getattr(settings, 'RUN_BACKGROUND_TASKS_INLINE', False):
+            if _inline_dispatcher is None:
+                _inline_dispatcher = Dispatcher(0, 0)
+            return _inline_dispatcher
+        if _dispatcher is None:
+            _dispatcher = Dispatcher(getattr(settings, 'NOTIFICATION_WORKERS', 4),
+                                     getattr(settings, 'NOTIFICATION_QUEUE_LIMIT', 1000))
+            atexit.register(_dispatcher.drain, getattr(settings, 'NOTIFICATION_DRAIN_TIMEOUT', 30))
+    return _dispatcher
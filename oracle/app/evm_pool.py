@@ -0,0 +1,238 @@
+"""
+Process pool for EVM work with multisig address affinity.
+
+State updates used to run in threads of the web process, so replays of
+unrelated states competed for one GIL. With `EVM_WORKERS` > 0 they run in
+worker processes instead. Every multisig address is sent to a fixed worker,
+chosen by hashing the address, so the updates of one state stay ordered and
+hit the same worker's caches while different states use all cores. Every
+worker answers on its own pipe. A worker which dies is restarted as soon as
+the pool notices and the jobs it held fail with EvmWorkerError.
+
+Workers are started by the `forkserver`, not forked from the pool's
+process: a restart happens while other threads may hold locks (logging,
+database connections, the dispatcher), which a forked child would inherit
+locked. A worker therefore sets up Django itself, and the jobs are
+functions importable by the workers.
+"""
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+import zlib
+
+import django
+from django.conf import settings
+
+_context = multiprocessing.get_context('forkserver')
+
+# set in the worker processes, which run their jobs inline
+in_worker = False
+
+
+class EvmWorkerError(Exception):
+    pass
+
+
+def _worker_main(tasks, results):
+    global in_worker
+    in_worker = True
+    django.setup()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, fn, args = task
+        started = time.time()
+        try:
+            result = (job_id, True, fn(*args), time.time() - started)
+        except Exception as e:
+            result = (job_id, False, '{}: {}'.format(type(e).__name__, e), time.time() - started)
+        try:
+            results.send(result)
+        except Exception as e:
+            # e.g. a return value which cannot be pickled
+            results.send((job_id, False, '{}: {}'.format(type(e).__name__, e), result[3]))
+
+
+class _Job(object):
+
+    def __init__(self, worker):
+        self.worker = worker
+        self.done = threading.Event()
+        self.succeeded = False
+        self.result = None
+
+
+class _Worker(object):
+    """
+    Worker process with its own task queue and result pipe, so a worker
+    dying mid-write cannot corrupt the channels of the others.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.tasks = _context.Queue()
+        self.results, writer = _context.Pipe(duplex=False)
+        self.process = _context.Process(target=_worker_main, args=(self.tasks, writer))
+        self.process.daemon = True
+        self.process.start()
+        # only the worker writes, its exit closes the pipe
+        writer.close()
+        self.started = time.time()
+
+
+class EvmPool(object):
+
+    def __init__(self, workers, timeout=600):
+        self.workers = workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._jobs = {}
+        self._counters = [{'jobs': 0, 'failed': 0, 'busy_time': 0.0, 'restarts': 0} for _ in range(workers)]
+        self._closed = False
+        self._workers = [_Worker(index) for index in range(workers)]
+        t = threading.Thread(target=self._collect)
+        t.daemon = True
+        t.start()
+
+    def worker_index(self, key):
+        return zlib.crc32(key.encode('utf-8')) % self.workers
+
+    def run(self, key, fn, *args):
+        """
+        Run `fn(*args)` in the worker of `key` and return its result.
+
+        Raises EvmWorkerError when `fn` raised, the worker died or it did
+        not answer in time.
+        """
+        index = self.worker_index(key)
+        job_id = next(self._job_ids)
+        with self._lock:
+            if self._closed:
+                raise EvmWorkerError('Pool is closed')
+            worker = self._workers[index]
+            job = self._jobs[job_id] = _Job(worker)
+            # queued under the lock, a restart fails the jobs of the worker it replaces
+            worker.tasks.put((job_id, fn, args))
+
+        if not job.done.wait(self.timeout):
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise EvmWorkerError('Worker {} timed out'.format(index))
+        if not job.succeeded:
+            raise EvmWorkerError(job.result)
+        return job.result
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            worker.tasks.put(None)
+        for worker in workers:
+            worker.process.join(5)
+
+    def stats(self):
+        with self._lock:
+            pending = [0] * self.workers
+            for job in self._jobs.values():
+                pending[job.worker.index] += 1
+            now = time.time()
+            return [
+                dict(counters,
+                     worker=index,
+                     pid=self._workers[index].process.pid,
+                     alive=self._workers[index].process.is_alive(),
+                     pending=pending[index],
+                     jobs_per_second=counters['jobs'] / (now - self._workers[index].started))
+                for index, counters in enumerate(self._counters)
+            ]
+
+    def _collect(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    break
+                readers = dict((worker.results, worker) for worker in self._workers)
+            for reader in multiprocessing.connection.wait(list(readers), timeout=1):
+                self._drain(readers[reader])
+            # checked on every pass, not only when no result arrives
+            for worker in readers.values():
+                if not worker.process.is_alive():
+                    self._drain(worker)
+                    self._restart(worker)
+
+        for worker in self._workers:
+            worker.results.close()
+
+    def _drain(self, worker):
+        try:
+            while worker.results.poll():
+                self._record(worker, *worker.results.recv())
+        except Exception:
+            # the pipe is closed or holds half a message of a dead worker
+            self._restart(worker)
+
+    def _record(self, worker, job_id, succeeded, result, elapsed):
+        with self._lock:
+            counters = self._counters[worker.index]
+            counters['jobs'] += 1
+            counters['busy_time'] += elapsed
+            if not succeeded:
+                counters['failed'] += 1
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.succeeded, job.result = succeeded, result
+            job.done.set()
+
+    def _restart(self, worker):
+        with self._lock:
+            if self._closed or self._workers[worker.index] is not worker:
+                return
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process.join(5)
+            worker.results.close()
+            print('EVM worker {} died with exit code {}, restarting'.format(worker.index, worker.process.exitcode))
+            self._counters[worker.index]['restarts'] += 1
+            self._workers[worker.index] = _Worker(worker.index)
+            # the jobs queued on the dead worker are lost, fail them now
+            failed = [(job_id, job) for job_id, job in self._jobs.items() if job.worker is worker]
+            for job_id, job in failed:
+                del self._jobs[job_id]
+        for _, job in failed:
+            job.result = 'Worker {} died'.format(worker.index)
+            job.done.set()
+
+
+_evm_pool = None
+_evm_pool_lock = threading.Lock()
+
+
+def get_evm_pool():
+    """
+    Return the process-wide EvmPool, or None when `EVM_WORKERS` is 0 or
+    when called from an EVM worker.
+    """
+    global _evm_pool
+    workers = getattr(settings, 'EVM_WORKERS', 0)
+    if not workers or in_worker:
+        return None
+    with _evm_pool_lock:
+        if _evm_pool is None:
+            _evm_pool = EvmPool(workers, getattr(settings, 'EVM_WORKER_TIMEOUT', 600))
+    return _evm_pool
+
+
+def run_for_state(multisig_address, fn, *args):
+    """
+    Run `fn(*args)` in the worker of `multisig_address`, or inline without
+    a pool.
+    """
+    evm_pool = get_evm_pool()
+    if evm_pool is None:
+        return fn(*args)
+    return evm_pool.run(multisig_address, fn, *args)
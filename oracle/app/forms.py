@@ -1,6 +1,9 @@
 import ast
+import collections
+import json
 
 from django import forms
+from django.conf import settings
 
 from .models import Keystore
 
@@ -16,6 +19,30 @@ class SignForm(forms.Form):
     amount = forms.IntegerField(required=True)
 
 
+class BatchSignForm(forms.Form):
+    raw_tx = forms.CharField(required=True)
+    inputs = forms.CharField(required=True)
+    state_multisig_address = forms.CharField(required=True)
+    contract_address = forms.CharField(required=False)
+
+    def clean_inputs(self):
+        """
+        `inputs` is a JSON list of {"input_index": <int>, "script": <hex>}.
+        """
+        try:
+            inputs = json.loads(self.cleaned_data.get('inputs'))
+            inputs = [(int(item['input_index']), str(item['script'])) for item in inputs]
+        except (ValueError, TypeError, KeyError):
+            raise forms.ValidationError(
+                'Should be a list of objects with `input_index` and `script`.'
+            )
+        if not inputs:
+            raise forms.ValidationError('Should have at least one input.')
+        if len(set(input_index for input_index, _ in inputs)) != len(inputs):
+            raise forms.ValidationError('`input_index` should be unique.')
+        return inputs
+
+
 class MultisigAddrFrom(forms.Form):
     pubkey = forms.CharField(required=False)
     pubkey_list = forms.CharField(required=False)
@@ -67,3 +94,72 @@ class MultisigAddrFrom(forms.Form):
 class NotifyForm(forms.Form):
     tx_hash = forms.CharField(max_length=100)
     subscription_id = forms.CharField(max_length=100)
+
+
+class BatchBalanceForm(forms.Form):
+    addresses = forms.CharField(required=False)
+    evm_addresses = forms.CharField(required=False)
+
+    def clean_addresses(self):
+        return self._clean_address_list('addresses')
+
+    def clean_evm_addresses(self):
+        return self._clean_address_list('evm_addresses')
+
+    def clean(self):
+        cleaned_data = super(BatchBalanceForm, self).clean()
+        count = len(cleaned_data.get('addresses') or []) + len(cleaned_data.get('evm_addresses') or [])
+        max_addresses = getattr(settings, 'BATCH_BALANCE_MAX_ADDRESSES', 5000)
+
+        if count == 0:
+            raise forms.ValidationError(
+                'Should have at least one of `addresses` or `evm_addresses`!'
+            )
+        if count > max_addresses:
+            raise forms.ValidationError(
+                'At most {} addresses can be queried at once.'.format(max_addresses)
+            )
+        return cleaned_data
+
+    def _clean_address_list(self, field):
+        value = self.cleaned_data.get(field)
+        if not value:
+            return []
+        try:
+            address_list = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            raise forms.ValidationError('Should be a list of addresses.')
+        if not isinstance(address_list, (list, tuple)) or \
+                not all(isinstance(address, str) for address in address_list):
+            raise forms.ValidationError('Should be a list of addresses.')
+        # drop duplicates but keep the order given by the client
+        return list(collections.OrderedDict.fromkeys(address_list))
+
+
+class StorageQueryForm(forms.Form):
+    keys = forms.CharField(required=False)
+    prefix = forms.CharField(required=False)
+    start = forms.CharField(required=False)
+    end = forms.CharField(required=False)
+    cursor = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1)
+
+    def clean_keys(self):
+        keys = self.cleaned_data.get('keys')
+        if not keys:
+            return []
+        return [key.strip() for key in keys.split(',') if key.strip()]
+
+    def clean_limit(self):
+        limit = self.cleaned_data.get('limit')
+        max_limit = getattr(settings, 'STORAGE_PAGE_MAX_SIZE', 1000)
+        if limit is None:
+            return min(100, max_limit)
+        if limit > max_limit:
+            raise forms.ValidationError(
+                '`limit` should be less than or equal to {}'.format(max_limit)
+            )
+        return limit
+
+    def is_paginated(self):
+        return any(field in self.data for field in self.fields)
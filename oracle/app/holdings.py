@@ -0,0 +1,88 @@
+"""
+Reverse index from EVM address to the balances it holds in every state file.
+
+The index is refreshed for one state whenever a transaction has been applied
+to it, so looking up a wallet across all contracts is a single indexed query
+instead of one state file parse per contract.
+"""
+import json
+import os
+
+from django.db import transaction
+
+from app.models import AddressHolding
+from app.state_cache import state_cache, state_path
+
+
+def _has_funds(balance):
+    for amount in balance.values():
+        try:
+            if int(amount) != 0:
+                return True
+        except (TypeError, ValueError):
+            return True
+    return False
+
+
+def index_state(multisig_address):
+    """
+    Bring the index rows of one state file in line with its accounts.
+
+    Only rows whose balance changed are written.
+    """
+    content = state_cache.get(multisig_address)
+    balances = {}
+    for evm_address, account in content['accounts'].items():
+        balance = account.get('balance') or {}
+        if _has_funds(balance):
+            balances[evm_address] = json.dumps(balance, sort_keys=True)
+
+    with transaction.atomic():
+        existing = dict(AddressHolding.objects.filter(
+            multisig_address=multisig_address).values_list('evm_address', 'balance'))
+
+        removed = [evm_address for evm_address in existing if evm_address not in balances]
+        if removed:
+            AddressHolding.objects.filter(multisig_address=multisig_address,
+                                          evm_address__in=removed).delete()
+
+        created = []
+        for evm_address, balance in balances.items():
+            if evm_address not in existing:
+                created.append(AddressHolding(evm_address=evm_address,
+                                              multisig_address=multisig_address,
+                                              balance=balance))
+            elif existing[evm_address] != balance:
+                AddressHolding.objects.filter(multisig_address=multisig_address,
+                                              evm_address=evm_address).update(balance=balance)
+        AddressHolding.objects.bulk_create(created)
+
+
+def list_states():
+    state_dir = os.path.dirname(state_path(''))
+    return sorted(name for name in os.listdir(state_dir)
+                  if not name.startswith('.') and os.path.isfile(os.path.join(state_dir, name)))
+
+
+def rebuild_index():
+    """
+    Rebuild the whole index from the state files on disk.
+
+    Returns the indexed and the failed multisig addresses.
+    """
+    indexed = []
+    failed = []
+    for multisig_address in list_states():
+        try:
+            index_state(multisig_address)
+            indexed.append(multisig_address)
+        except (IOError, ValueError, KeyError):
+            failed.append(multisig_address)
+
+    AddressHolding.objects.exclude(multisig_address__in=indexed + failed).delete()
+    return indexed, failed
+
+
+def get_holdings(evm_address):
+    holdings = AddressHolding.objects.filter(evm_address=evm_address)
+    return {holding.multisig_address: json.loads(holding.balance) for holding in holdings}
@@ -0,0 +1,318 @@
+"""
+Notification queues.
+
+With `NOTIFICATION_QUEUE = 'database'` the webhooks only insert a
+NotificationJob row and return; the `run_notification_worker` command
+processes the rows and can run as any number of processes. Every job
+records the state file it writes; a worker first inserts the StateLock row
+of that state, so only one worker processes the jobs of a state, then
+claims the oldest pending job of the state. Failed jobs are retried with
+exponential backoff until `JOB_MAX_ATTEMPTS`, and the later jobs of their
+state wait for them. A running job renews its lease every third of
+`JOB_LEASE_TIMEOUT`, so only the jobs of a worker which died are released. When a worker claims an address job it also claims
+the address jobs queued right after it and processes them together.
+
+Notifications already queued are not queued again: `is_queued` checks the
+job table and `in_flight` tracks the notifications of the in-process
+dispatcher.
+"""
+import collections
+import datetime
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from app.models import NotificationJob, Proposal, StateLock
+
+
+class DeployFailed(Exception):
+    pass
+
+
+class InFlight(object):
+    """
+    Notifications accepted by this process and not processed yet.
+
+    A tx notification duplicates any notification of the same tx, an
+    address notification only one of the same tx and address, since it also
+    updates the utxo set of the address.
+    """
+
+    def __init__(self):
+        self._txs = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def add(self, tx_hash, multisig_address=''):
+        """
+        Returns False when the notification duplicates one in flight.
+        """
+        with self._lock:
+            addresses = self._txs.get(tx_hash)
+            if addresses and (not multisig_address or multisig_address in addresses):
+                return False
+            self._txs[tx_hash].add(multisig_address)
+            return True
+
+    def discard(self, tx_hash, multisig_address=''):
+        with self._lock:
+            addresses = self._txs.get(tx_hash)
+            if addresses is None:
+                return
+            addresses.discard(multisig_address)
+            if not addresses:
+                del self._txs[tx_hash]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._txs)
+
+
+in_flight = InFlight()
+
+
+def is_queued(tx_hash, multisig_address=''):
+    """
+    Same rules as `InFlight.add` for the jobs waiting in the job table.
+    """
+    queued = NotificationJob.objects.filter(
+        tx_hash=tx_hash, status__in=[NotificationJob.STATUS_PENDING, NotificationJob.STATUS_RUNNING])
+    if multisig_address:
+        queued = queued.filter(kind=NotificationJob.KIND_ADDRESS, multisig_address=multisig_address)
+    return queued.exists()
+
+
+def enqueue(kind, tx_hash, multisig_address=''):
+    state_address = ''
+    if kind == NotificationJob.KIND_ADDRESS and Proposal.objects.filter(
+            multisig_address=multisig_address, is_state_multisig=True).exists():
+        state_address = multisig_address
+    return NotificationJob.objects.create(kind=kind, tx_hash=tx_hash, multisig_address=multisig_address,
+                                          state_address=state_address, next_run_at=timezone.now())
+
+
+def resolve_state(job):
+    """
+    Return the multisig address of the state file `job` writes.
+    """
+    if job.kind == NotificationJob.KIND_ADDRESS and Proposal.objects.filter(
+            multisig_address=job.multisig_address, is_state_multisig=True).exists():
+        return job.multisig_address
+    from smart_contract_utils.ContractTxInfo import ContractTxInfo
+    state_address = ContractTxInfo(job.tx_hash).get_state_multisig_address()
+    if not state_address:
+        raise ValueError('No state for tx {}'.format(job.tx_hash))
+    return state_address
+
+
+def resolve_states(now, limit):
+    """
+    Record the state of the due jobs enqueued without one, so they are
+    serialised with the other jobs of that state.
+    """
+    unresolved = NotificationJob.objects.filter(
+        status=NotificationJob.STATUS_PENDING, state_address='', next_run_at__lte=now)[:limit]
+    for job in unresolved:
+        try:
+            state_address = resolve_state(job)
+        except Exception as e:
+            print('Cannot resolve the state of job {}: {}'.format(job.id, e))
+            fail_one(job, e)
+            continue
+        NotificationJob.objects.filter(id=job.id, state_address='').update(state_address=state_address)
+
+
+def release_expired(now):
+    """
+    Put back the jobs and state locks of workers which died while running
+    them.
+    """
+    lease = datetime.timedelta(seconds=getattr(settings, 'JOB_LEASE_TIMEOUT', 600))
+    released = NotificationJob.objects.filter(
+        status=NotificationJob.STATUS_RUNNING, claimed_at__lt=now - lease
+    ).update(status=NotificationJob.STATUS_PENDING, claimed_by='', claimed_at=None)
+    StateLock.objects.filter(claimed_at__lt=now - lease).delete()
+    return released
+
+
+def lock_state(state_address, worker_id, now):
+    """
+    Returns False when another worker holds the lock of `state_address`.
+    """
+    try:
+        with transaction.atomic():
+            StateLock.objects.create(state_address=state_address, claimed_by=worker_id, claimed_at=now)
+        return True
+    except IntegrityError:
+        return False
+
+
+def unlock_state(state_address, worker_id):
+    StateLock.objects.filter(state_address=state_address, claimed_by=worker_id).delete()
+
+
+def claim(worker_id, limit=1):
+    """
+    Claim up to `limit` due jobs for `worker_id`, at most one per state.
+
+    The state lock is held until the job completes, fails or is released,
+    so no two workers process jobs of one state at the same time. The
+    oldest pending job of a state is always the one claimed: while it waits
+    for a retry the later jobs of its state wait too.
+    """
+    now = timezone.now()
+    release_expired(now)
+    resolve_states(now, limit * 4)
+
+    candidates = NotificationJob.objects.filter(
+        status=NotificationJob.STATUS_PENDING, next_run_at__lte=now).exclude(state_address='')[:limit * 4]
+
+    claimed = []
+    states = set()
+    for candidate in candidates:
+        state_address = candidate.state_address
+        if state_address in states or not lock_state(state_address, worker_id, now):
+            continue
+        head = NotificationJob.objects.filter(
+            state_address=state_address, status=NotificationJob.STATUS_PENDING).order_by('id').first()
+        if head is None or head.next_run_at > now:
+            unlock_state(state_address, worker_id)
+            continue
+        updated = NotificationJob.objects.filter(id=head.id, status=NotificationJob.STATUS_PENDING).update(
+            status=NotificationJob.STATUS_RUNNING, claimed_by=worker_id, claimed_at=now)
+        if not updated:
+            unlock_state(state_address, worker_id)
+            continue
+        head.status, head.claimed_by, head.claimed_at = NotificationJob.STATUS_RUNNING, worker_id, now
+        head.merged = claim_merged(head, worker_id, now)
+        claimed.append(head)
+        states.add(state_address)
+        if len(claimed) >= limit:
+            break
+    return claimed
+
+
+def claim_merged(job, worker_id, now):
+    """
+    Claim the due address jobs queued right after `job` for its address and
+    state, stopping at the first job of the state which cannot be merged.
+    """
+    if job.kind != NotificationJob.KIND_ADDRESS:
+        return []
+    ids = []
+    following = NotificationJob.objects.filter(
+        state_address=job.state_address, status=NotificationJob.STATUS_PENDING, id__gt=job.id).order_by('id')
+    for other in following:
+        if (other.kind != NotificationJob.KIND_ADDRESS or other.multisig_address != job.multisig_address
+                or other.next_run_at > now):
+            break
+        ids.append(other.id)
+    if not ids:
+        return []
+    NotificationJob.objects.filter(id__in=ids, status=NotificationJob.STATUS_PENDING).update(
+        status=NotificationJob.STATUS_RUNNING, claimed_by=worker_id, claimed_at=now)
+    return list(NotificationJob.objects.filter(
+        id__in=ids, status=NotificationJob.STATUS_RUNNING, claimed_by=worker_id, claimed_at=now).order_by('id'))
+
+
+def group(job):
+    return [job] + getattr(job, 'merged', [])
+
+
+def release(job):
+    NotificationJob.objects.filter(id__in=[j.id for j in group(job)], status=NotificationJob.STATUS_RUNNING).update(
+        status=NotificationJob.STATUS_PENDING, claimed_by='', claimed_at=None)
+    unlock_state(job.state_address, job.claimed_by)
+
+
+def backoff(attempts):
+    base = getattr(settings, 'JOB_RETRY_BASE_DELAY', 5)
+    maximum = getattr(settings, 'JOB_RETRY_MAX_DELAY', 3600)
+    return min(base * 2 ** (attempts - 1), maximum)
+
+
+def complete(job):
+    NotificationJob.objects.filter(id__in=[j.id for j in group(job)]).update(
+        status=NotificationJob.STATUS_DONE, last_error='')
+    unlock_state(job.state_address, job.claimed_by)
+
+
+def fail(job, error):
+    """
+    Schedule a retry of `job` and the jobs merged into it, or mark them
+    failed after `JOB_MAX_ATTEMPTS`. Returns the status of `job`.
+    """
+    statuses = [fail_one(j, error) for j in group(job)]
+    unlock_state(job.state_address, job.claimed_by)
+    return statuses[0]
+
+
+def fail_one(job, error):
+    attempts = job.attempts + 1
+    if attempts >= getattr(settings, 'JOB_MAX_ATTEMPTS', 10):
+        status = NotificationJob.STATUS_FAILED
+        next_run_at = job.next_run_at
+    else:
+        status = NotificationJob.STATUS_PENDING
+        next_run_at = timezone.now() + datetime.timedelta(seconds=backoff(attempts))
+    NotificationJob.objects.filter(id=job.id).update(
+        status=status, attempts=attempts, next_run_at=next_run_at, claimed_by='', claimed_at=None,
+        last_error=str(error))
+    return status
+
+
+def run_job(job):
+    from app.views import address_deploy_many, evm_deploy
+
+    if job.kind == NotificationJob.KIND_ADDRESS:
+        completed = address_deploy_many(job.multisig_address, [j.tx_hash for j in group(job)])
+    else:
+        completed = evm_deploy(job.tx_hash, job.state_address)
+    if not completed:
+        raise DeployFailed('Deploy {} failed'.format(job.tx_hash))
+
+
+def renew(job):
+    """
+    Extend the lease of `job`, the jobs merged into it and their state lock.
+    Returns False when the lease was already released.
+    """
+    now = timezone.now()
+    renewed = NotificationJob.objects.filter(
+        id__in=[j.id for j in group(job)], status=NotificationJob.STATUS_RUNNING, claimed_by=job.claimed_by
+    ).update(claimed_at=now)
+    StateLock.objects.filter(state_address=job.state_address, claimed_by=job.claimed_by).update(claimed_at=now)
+    return renewed > 0
+
+
+def keep_lease(job, done):
+    # a long replay must not be reclaimed by another worker while it runs
+    interval = getattr(settings, 'JOB_LEASE_TIMEOUT', 600) / 3.0
+    try:
+        while not done.wait(interval):
+            try:
+                if not renew(job):
+                    print('Lease of job {} was lost'.format(job.id))
+            except Exception as e:
+                print('Renew lease of job {} failed: {}'.format(job.id, e))
+    finally:
+        connection.close()
+
+
+def process(job):
+    done = threading.Event()
+    keeper = threading.Thread(target=keep_lease, args=[job, done])
+    keeper.daemon = True
+    keeper.start()
+    try:
+        try:
+            run_job(job)
+        finally:
+            done.set()
+            keeper.join()
+    except Exception as e:
+        print('Job {} failed: {}'.format(job.id, e))
+        return fail(job, e)
+    complete(job)
+    return NotificationJob.STATUS_DONE
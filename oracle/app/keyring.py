@@ -0,0 +1,79 @@
+"""
+Process-level keyring of the signing keys.
+
+The sign path used to look up the Proposal and then the Keystore of the
+state multisig on every request and hand the hex private key to `multisign`,
+which decoded it again. The keyring loads every multisig -> key mapping once,
+with the private keys already loaded by the configured signer, and is invalidated whenever a
+Proposal or a Keystore is saved or deleted.
+"""
+import collections
+import threading
+
+from django.db.models.signals import post_delete, post_save
+
+from app.models import Keystore, Proposal
+from gcoinbackend.signers import get_signer
+
+SigningKey = collections.namedtuple('SigningKey', ['public_key', 'private_key'])
+
+
+def parse_private_key(private_key):
+    return get_signer().load_key(private_key)
+
+
+class Keyring(object):
+
+    def __init__(self):
+        self._keys = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        private_keys = dict(Keystore.objects.values_list('public_key', 'private_key'))
+        keys = {}
+        for multisig_address, public_key in Proposal.objects.values_list('multisig_address', 'public_key'):
+            if public_key in private_keys:
+                keys[multisig_address] = SigningKey(public_key, parse_private_key(private_keys[public_key]))
+        with self._lock:
+            self._keys = keys
+        return keys
+
+    def get(self, multisig_address):
+        """
+        Return the SigningKey of `multisig_address`.
+
+        Raises Proposal.DoesNotExist or Keystore.DoesNotExist when the oracle
+        has no key for the address.
+        """
+        with self._lock:
+            keys = self._keys
+        if keys is None:
+            keys = self.load()
+
+        key = keys.get(multisig_address)
+        if key is None:
+            # the proposal may have been created by another process
+            proposal = Proposal.objects.get(multisig_address=multisig_address)
+            private_key = Keystore.objects.get(public_key=proposal.public_key).private_key
+            key = SigningKey(proposal.public_key, parse_private_key(private_key))
+            with self._lock:
+                if self._keys is keys:
+                    keys[multisig_address] = key
+        return key
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+
+
+keyring = Keyring()
+
+
+def invalidate_keyring(sender, **kwargs):
+    keyring.invalidate()
+
+
+def connect_signals():
+    for model in (Keystore, Proposal):
+        post_save.connect(invalidate_keyring, sender=model, dispatch_uid='keyring_' + model.__name__ + '_save')
+        post_delete.connect(invalidate_keyring, sender=model, dispatch_uid='keyring_' + model.__name__ + '_delete')
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+async def fetch(host, port, request, timeout):
+    # one connection per request, like the OSS callbacks
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_clients(url, method, data, concurrency, requests, timeout):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    body = data.encode('utf-8')
+    request = ('{} {} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n'
+               'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {}\r\n\r\n'
+               .format(method, path, parts.netloc, len(body))).encode('latin-1') + body
+    remaining = [requests]
+    latencies = []
+    errors = []
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.time()
+            try:
+                status = await fetch(parts.hostname, parts.port or 80, request, timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                errors.append(type(e).__name__)
+                continue
+            if status >= 500:
+                errors.append(str(status))
+            else:
+                latencies.append(time.time() - started)
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput and latency of an endpoint at increasing concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='e.g. http://127.0.0.1:8000/api/v1/balance/<multisig>/<address>')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', default='', help='Form-encoded request body.')
+        parser.add_argument('--concurrency', default='10,100,1000',
+                            help='Comma-separated numbers of concurrent connections.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per concurrency level.')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        if not options['url'].startswith('http://'):
+            raise CommandError('Only http:// URLs are supported')
+        loop = asyncio.get_event_loop()
+
+        for concurrency in [int(level) for level in options['concurrency'].split(',')]:
+            started = time.time()
+            latencies, errors = loop.run_until_complete(run_clients(
+                options['url'], options['method'].upper(), options['data'],
+                concurrency, options['requests'], options['timeout']))
+            elapsed = time.time() - started
+
+            if not latencies:
+                self.stdout.write('concurrency {}: all {} requests failed'.format(concurrency, len(errors)))
+                continue
+            latencies.sort()
+            self.stdout.write('concurrency {}: {:.1f} requests/s, p50 {:.1f} ms, p99 {:.1f} ms, {} errors'.format(
+                concurrency, len(latencies) / elapsed,
+                percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, len(errors)))
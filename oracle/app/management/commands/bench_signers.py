@@ -0,0 +1,41 @@
+import binascii
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+DEFAULT_SIGNERS = [
+    'gcoinbackend.signers.GcoinSigner',
+    'gcoinbackend.signers.Secp256k1Signer',
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure signatures per second of the signer backends.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('signers', nargs='*', default=DEFAULT_SIGNERS,
+                            help='Dotted paths of the signer classes to benchmark.')
+        parser.add_argument('--iterations', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        private_key = binascii.hexlify(os.urandom(32)).decode('ascii')
+        hashes = [os.urandom(32) for _ in range(options['iterations'])]
+        results = {}
+
+        for path in options['signers']:
+            try:
+                signer = import_string(path)()
+            except ImportError as e:
+                self.stderr.write('Skip {}: {}'.format(path, e))
+                continue
+
+            key = signer.load_key(private_key)
+            start = time.time()
+            results[path] = [signer.sign_hash(msghash, key) for msghash in hashes]
+            elapsed = time.time() - start
+            self.stdout.write('{}: {:.1f} signatures/s'.format(path, len(hashes) / elapsed))
+
+        if len(set(tuple(signatures) for signatures in results.values())) > 1:
+            self.stderr.write('Signers produced different signatures!')
@@ -0,0 +1,42 @@
+import concurrent.futures
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.catchup import timed_catch_up
+from app.models import Proposal
+
+
+class Command(BaseCommand):
+    help = 'Apply the txs missed by the state files while the oracle was down.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('multisig_addresses', nargs='*',
+                            help='Only catch up these addresses instead of every state multisig.')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Number of addresses caught up in parallel.')
+
+    def handle(self, *args, **options):
+        multisig_addresses = options['multisig_addresses'] or list(Proposal.objects.filter(
+            is_state_multisig=True).values_list('multisig_address', flat=True))
+
+        started = time.time()
+        applied = 0
+        failed = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            futures = {executor.submit(timed_catch_up, multisig_address): multisig_address
+                       for multisig_address in multisig_addresses}
+            for future in concurrent.futures.as_completed(futures):
+                multisig_address = futures[future]
+                try:
+                    count, elapsed = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write('Cannot catch up {}: {}'.format(multisig_address, e))
+                    continue
+                applied += count
+                self.stdout.write('Caught up {}: {} txs in {:.1f}s'.format(multisig_address, count, elapsed))
+
+        elapsed = time.time() - started
+        self.stdout.write('{} addresses, {} txs, {} failed in {:.1f}s ({:.1f} txs/s)'.format(
+            len(multisig_addresses), applied, failed, elapsed, applied / elapsed if elapsed else 0.0))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.chain_follower import ChainFollower, start_at
+from app.dispatcher import QueueFull
+
+
+class Command(BaseCommand):
+    help = 'Follow the chain and queue the txs of the registered multisig addresses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='default',
+                            help='Name of the persisted cursor.')
+        parser.add_argument('--start-at',
+                            help='Process the blocks after this block hash.')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='Seconds to sleep at the chain tip.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit at the chain tip.')
+
+    def handle(self, *args, **options):
+        if options['start_at']:
+            start_at(options['name'], options['start_at'])
+        follower = ChainFollower(options['name'])
+
+        while True:
+            close_old_connections()
+            started = time.time()
+            try:
+                processed = follower.follow(max_blocks=1000)
+            except QueueFull as e:
+                self.stderr.write(str(e))
+                time.sleep(options['poll_interval'])
+                continue
+            except Exception as e:
+                self.stderr.write('Follow failed: {}'.format(e))
+                time.sleep(options['poll_interval'])
+                continue
+
+            if processed:
+                elapsed = time.time() - started
+                self.stdout.write('{} blocks in {:.1f}s ({:.1f} blocks/s), {} txs queued so far'.format(
+                    processed, elapsed, processed / elapsed if elapsed else 0.0, follower.queued))
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
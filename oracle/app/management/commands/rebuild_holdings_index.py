@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from app import holdings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the address holdings index from the state files.'
+
+    def handle(self, *args, **options):
+        indexed, failed = holdings.rebuild_index()
+        for multisig_address in failed:
+            self.stderr.write('Cannot index state {}'.format(multisig_address))
+        self.stdout.write('Indexed {} state files.'.format(len(indexed)))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from app import utxos as utxo_utils
+from app.models import Proposal
+
+
+class Command(BaseCommand):
+    help = 'Reconcile the local utxo sets of the state multisig addresses against OSS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('multisig_addresses', nargs='*',
+                            help='Only reconcile these addresses instead of every state multisig.')
+
+    def handle(self, *args, **options):
+        multisig_addresses = options['multisig_addresses'] or Proposal.objects.filter(
+            is_state_multisig=True).values_list('multisig_address', flat=True)
+
+        for multisig_address in multisig_addresses:
+            try:
+                utxo_utils.reconcile(multisig_address)
+                self.stdout.write('Reconciled {}'.format(multisig_address))
+            except Exception as e:
+                self.stderr.write('Cannot reconcile {}: {}'.format(multisig_address, e))
@@ -0,0 +1,48 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app import jobs
+
+
+class Command(BaseCommand):
+    help = 'Process the notification jobs queued in the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=10,
+                            help='Number of jobs claimed at once.')
+        parser.add_argument('--poll-interval', type=float, default=1,
+                            help='Seconds to sleep when no job is due.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        worker_id = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.stopped = False
+
+        def stop(signum, frame):
+            self.stopped = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write('Worker {} started'.format(worker_id))
+        while not self.stopped:
+            close_old_connections()
+            claimed = jobs.claim(worker_id, options['batch'])
+            if not claimed:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            for job in claimed:
+                # jobs claimed but not started are released for other workers
+                if self.stopped:
+                    jobs.release(job)
+                    continue
+                status = jobs.process(job)
+                self.stdout.write('Job {} {} {}: {}'.format(job.id, job.kind, job.tx_hash, status))
+        self.stdout.write('Worker {} stopped'.format(worker_id))
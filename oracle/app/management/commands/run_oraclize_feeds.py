@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.oraclize_feeds import FeedScheduler
+
+
+class Command(BaseCommand):
+    help = 'Poll the oraclize feeds and push the changed values into their contracts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-sleep', type=float, default=5,
+                            help='Longest sleep in seconds between two checks for due feeds.')
+        parser.add_argument('--once', action='store_true',
+                            help='Poll the due feeds once and exit.')
+
+    def handle(self, *args, **options):
+        scheduler = FeedScheduler()
+
+        while True:
+            close_old_connections()
+            try:
+                applied = scheduler.run_due()
+            except Exception as e:
+                self.stderr.write('Feed run failed: {}'.format(e))
+                applied = 0
+
+            if applied:
+                stats = scheduler.stats()
+                self.stdout.write(
+                    '{} updates applied; {applied} applied, {failed} failed and {skipped} skipped in total, '
+                    '{writes_per_update:.2f} state writes and {bytes_per_update:.0f} bytes written per update, '
+                    'latency avg {avg_latency:.2f}s max {max_latency:.2f}s'.format(
+                        applied, skipped=stats['skipped_threshold'] + stats['skipped_debounce'], **stats))
+            if options['once']:
+                break
+
+            delay = scheduler.next_poll_delay()
+            time.sleep(options['max_sleep'] if delay is None else min(delay, options['max_sleep']))
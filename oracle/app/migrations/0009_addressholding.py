@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_auto_20170626_0833'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressHolding',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('evm_address', models.CharField(max_length=100, db_index=True)),
+                ('multisig_address', models.CharField(max_length=100, db_index=True)),
+                ('balance', models.TextField()),
+            ],
+            options={
+                'ordering': ('multisig_address',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='addressholding',
+            unique_together=set([('evm_address', 'multisig_address')]),
+        ),
+    ]
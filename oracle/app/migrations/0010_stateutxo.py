@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_addressholding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StateUtxo',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('multisig_address', models.CharField(max_length=100, db_index=True)),
+                ('txid', models.CharField(max_length=64)),
+                ('vout', models.IntegerField()),
+                ('block_time', models.IntegerField(null=True, blank=True)),
+            ],
+            options={
+                'ordering': ('block_time', 'id'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='stateutxo',
+            unique_together=set([('multisig_address', 'txid', 'vout')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_stateutxo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StateTransaction',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('multisig_address', models.CharField(max_length=100)),
+                ('tx_hash', models.CharField(max_length=64)),
+                ('version', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('multisig_address', 'version'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='statetransaction',
+            unique_together=set([('multisig_address', 'tx_hash'), ('multisig_address', 'version')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_statetransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('kind', models.CharField(max_length=10, choices=[('address', 'address'), ('tx', 'tx')])),
+                ('multisig_address', models.CharField(max_length=100, blank=True, db_index=True)),
+                ('tx_hash', models.CharField(max_length=64)),
+                ('status', models.CharField(max_length=10, default='pending', choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')])),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_run_at', models.DateTimeField()),
+                ('claimed_by', models.CharField(max_length=100, blank=True)),
+                ('claimed_at', models.DateTimeField(null=True, blank=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('next_run_at', 'id'),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='notificationjob',
+            index_together=set([('status', 'next_run_at')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_notificationjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='statetransaction',
+            name='tx_hash',
+            field=models.CharField(max_length=64, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='notificationjob',
+            name='tx_hash',
+            field=models.CharField(max_length=64, db_index=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_chaincursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OraclizeFeed',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('multisig_address', models.CharField(max_length=100)),
+                ('source', models.TextField()),
+                ('source_key', models.CharField(max_length=100, blank=True)),
+                ('interval', models.FloatField(default=60)),
+                ('threshold', models.FloatField(default=0)),
+                ('debounce', models.FloatField(default=0)),
+                ('enabled', models.BooleanField(default=True)),
+                ('last_value', models.CharField(max_length=100, blank=True)),
+                ('last_pushed_at', models.DateTimeField(null=True, blank=True)),
+                ('next_poll_at', models.DateTimeField(null=True, blank=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('oraclize_contract', models.ForeignKey(to='app.OraclizeContract')),
+            ],
+            options={
+                'ordering': ('next_poll_at', 'id'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='oraclizefeed',
+            unique_together=set([('oraclize_contract', 'multisig_address')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_oraclizefeed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationjob',
+            name='state_address',
+            field=models.CharField(max_length=100, blank=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='StateLock',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('state_address', models.CharField(max_length=100, unique=True)),
+                ('claimed_by', models.CharField(max_length=100)),
+                ('claimed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
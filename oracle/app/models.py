@@ -66,3 +66,135 @@ class Proposal(models.Model):
             'multisig_address': self.multisig_address,
             'is_state_multisig': self.is_state_multisig
         }
+
+
+class AddressHolding(models.Model):
+    """
+    Reverse index of the balances an EVM address holds in each state file.
+    """
+    evm_address = models.CharField(max_length=100, db_index=True)
+    multisig_address = models.CharField(max_length=100, db_index=True)
+    balance = models.TextField()
+
+    class Meta:
+        unique_together = ('evm_address', 'multisig_address')
+        ordering = ('multisig_address',)
+
+
+class StateUtxo(models.Model):
+    """
+    Unspent output of a state multisig address, kept up to date from
+    address notifications and reconciled against OSS.
+    """
+    multisig_address = models.CharField(max_length=100, db_index=True)
+    txid = models.CharField(max_length=64)
+    vout = models.IntegerField()
+    block_time = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('multisig_address', 'txid', 'vout')
+        ordering = ('block_time', 'id')
+
+    def as_outpoint(self):
+        return (self.txid, self.vout)
+
+
+class StateTransaction(models.Model):
+    """
+    Ledger of the txs applied to a state file. `version` increases by one
+    with every tx applied to the same multisig address.
+    """
+    multisig_address = models.CharField(max_length=100)
+    tx_hash = models.CharField(max_length=64, db_index=True)
+    version = models.IntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('multisig_address', 'tx_hash'), ('multisig_address', 'version'))
+        ordering = ('multisig_address', 'version')
+
+
+class NotificationJob(models.Model):
+    """
+    Notification accepted by a webhook, processed by the
+    `run_notification_worker` command.
+    """
+    KIND_ADDRESS = 'address'
+    KIND_TX = 'tx'
+    KIND_CHOICES = (
+        (KIND_ADDRESS, 'address'),
+        (KIND_TX, 'tx'),
+    )
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'pending'),
+        (STATUS_RUNNING, 'running'),
+        (STATUS_DONE, 'done'),
+        (STATUS_FAILED, 'failed'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    multisig_address = models.CharField(max_length=100, blank=True, db_index=True)
+    # state file the job writes, resolved by the worker when not known at enqueue
+    state_address = models.CharField(max_length=100, blank=True, db_index=True)
+    tx_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    next_run_at = models.DateTimeField()
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = ('status', 'next_run_at')
+        ordering = ('next_run_at', 'id')
+
+
+class StateLock(models.Model):
+    """
+    Held by the notification worker processing the jobs of a state; the
+    unique key lets only one worker insert it.
+    """
+    state_address = models.CharField(max_length=100, unique=True)
+    claimed_by = models.CharField(max_length=100)
+    claimed_at = models.DateTimeField()
+
+
+class ChainCursor(models.Model):
+    """
+    Last block processed by a chain follower.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    block_hash = models.CharField(max_length=64)
+    height = models.IntegerField()
+    updated = models.DateTimeField(auto_now=True)
+
+
+class OraclizeFeed(models.Model):
+    """
+    External value pushed into an oraclize contract of a state file by the
+    `run_oraclize_feeds` command. `source` is a URL or the dotted path of a
+    callable; `threshold` is the smallest change worth a write and
+    `debounce` the seconds between two writes.
+    """
+    oraclize_contract = models.ForeignKey(OraclizeContract)
+    multisig_address = models.CharField(max_length=100)
+    source = models.TextField()
+    source_key = models.CharField(max_length=100, blank=True)
+    interval = models.FloatField(default=60)
+    threshold = models.FloatField(default=0)
+    debounce = models.FloatField(default=0)
+    enabled = models.BooleanField(default=True)
+    last_value = models.CharField(max_length=100, blank=True)
+    last_pushed_at = models.DateTimeField(null=True, blank=True)
+    next_poll_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('oraclize_contract', 'multisig_address')
+        ordering = ('next_poll_at', 'id')
@@ -1,23 +1,311 @@
-import os
+"""
+Run oraclize contract calls on the state files with the Go `evm`.
+
+`SubprocessExecutor` starts the `evm` binary once per call, which reads the
+whole state file and writes it back. `PersistentExecutor` keeps one EVM
+server process alive instead, started with `EVM_SERVER_COMMAND`, so the
+server can keep hot states in memory. It speaks one JSON object per line
+over stdin/stdout; a request carries the flags of the one-shot call
+
+    {"read": path, "write": path, "receiver": address, "code": hex, "deploy": true}
+    {"read": path, "write": path, "receiver": address, "input": hex}
+
+and the server answers {"ok": true} or {"ok": false, "error": message}
+once the state file is written. A batch request replaces "receiver" and
+"input" by a list of calls, applied in order on one load of the state:
+
+    {"read": path, "write": path, "calls": [{"receiver": address, "input": hex}, ...]}
+
+A failed call leaves the state as it was before that call and the server
+answers {"ok": true, "results": [{"ok": ..., "error": ...}, ...]}. When
+the server cannot be started, calls fall back to the one-shot subprocess.
+A server which dies or does not answer within `EVM_SERVER_TIMEOUT` after
+reading a request is killed and the call fails with EvmError: the server
+may have written the state file, so the call is not run again.
+"""
+import json
 import locale
+import os
+import select
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from app.state_cache import file_signature, state_cache, state_file_lock
+
+EVM_PATH = os.path.dirname(os.path.abspath(__file__)) + '/../../go-ethereum/build/bin/evm'
+STATES_PATH = os.path.dirname(os.path.abspath(__file__)) + '/../states/'
+
+
+class EvmError(Exception):
+    pass
+
+
+def contract_path(multisig_address):
+    return STATES_PATH + multisig_address
+
+
+class BaseExecutor(object):
+
+    def run(self, request):
+        """
+        Execute `request`, a dict of the `evm` flags, on the state file
+        named by its `read` and `write` entries.
+
+        Raises EvmError when the EVM failed.
+        """
+        raise NotImplementedError
+
+    def run_batch(self, path, calls):
+        """
+        Apply `calls`, a list of (receiver, input), in order on the state
+        file `path` and return an (ok, error) pair per call.
+        """
+        results = []
+        for receiver, input_data in calls:
+            try:
+                self.run({'read': path, 'input': input_data, 'receiver': receiver, 'write': path})
+                results.append((True, None))
+            except EvmError as e:
+                results.append((False, str(e)))
+        return results
+
+    def close(self):
+        pass
+
+
+class SubprocessExecutor(BaseExecutor):
+
+    def run(self, request):
+        command = [EVM_PATH]
+        if 'code' in request:
+            command += ['--code', request['code']]
+        if request.get('deploy'):
+            command += ['--deploy']
+        command += ['--read', request['read']]
+        if 'input' in request:
+            command += ['--input', request['input']]
+        command += ['--receiver', request['receiver'], '--write', request['write']]
+        try:
+            # arguments are passed as a list, no shell parses the byte code
+            subprocess.check_call(command)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise EvmError(str(e))
+
+
+class PersistentExecutor(BaseExecutor):
 
-from subprocess import check_call
+    def __init__(self, command=None, retry_delay=None, timeout=None):
+        self.command = shlex.split(command or getattr(settings, 'EVM_SERVER_COMMAND', ''))
+        self.retry_delay = getattr(settings, 'EVM_SERVER_RETRY_DELAY', 30) if retry_delay is None else retry_delay
+        self.timeout = getattr(settings, 'EVM_SERVER_TIMEOUT', 60) if timeout is None else timeout
+        self.fallback = SubprocessExecutor()
+        self.calls = 0
+        self.fallbacks = 0
+        self.restarts = 0
+        self.timeouts = 0
+        self._process = None
+        self._buffer = b''
+        self._failed_at = None
+        # requests and answers are matched by order on the pipes
+        self._lock = threading.Lock()
+
+    def _start(self):
+        if self._failed_at is not None and time.time() - self._failed_at < self.retry_delay:
+            return None
+        try:
+            self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as e:
+            print('Cannot start EVM server: ' + str(e))
+            self._failed_at = time.time()
+            return None
+        self._buffer = b''
+        self._failed_at = None
+        self.restarts += 1
+        return self._process
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def _stop(self):
+        self._kill()
+        self._failed_at = time.time()
+
+    def _read_line(self, process, deadline):
+        """
+        Read one answer line, or b'' when the server exited.
+        """
+        fd = process.stdout.fileno()
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.time()
+            # a hung server must not hold the lock forever
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                self.timeouts += 1
+                raise EvmError('EVM server did not answer within {}s'.format(self.timeout))
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return b''
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def _request(self, request):
+        """
+        Send `request` to the server and return its answer, or None when
+        the request did not reach the server and must fall back to the
+        subprocess.
+
+        Raises EvmError when the server failed after reading the request:
+        it may have written the state file already, so the request is not
+        run again.
+        """
+        self.calls += 1
+        process = self._process
+        if process is None or process.poll() is not None:
+            process = self._start() if self.command else None
+        if process is not None:
+            try:
+                process.stdin.write(json.dumps(request).encode('utf-8') + b'\n')
+                process.stdin.flush()
+            except (IOError, OSError) as e:
+                print('EVM server failed, using subprocess: ' + str(e))
+                self._stop()
+                process = None
+        if process is None:
+            self.fallbacks += 1
+            return None
+
+        try:
+            line = self._read_line(process, time.time() + self.timeout)
+            if not line:
+                raise EvmError('EVM server exited with code {}'.format(process.wait()))
+            return json.loads(line.decode('utf-8'))
+        except (EvmError, IOError, OSError, ValueError) as e:
+            print('EVM server failed, restarting it: ' + str(e))
+            # the server is started again by the next call
+            self._kill()
+            raise EvmError(str(e))
+
+    def run(self, request):
+        with self._lock:
+            answer = self._request(request)
+        if answer is None:
+            self.fallback.run(request)
+        elif not answer.get('ok'):
+            raise EvmError(answer.get('error', 'EVM server error'))
+
+    def run_batch(self, path, calls):
+        request = {'read': path, 'write': path,
+                   'calls': [{'receiver': receiver, 'input': input_data} for receiver, input_data in calls]}
+        with self._lock:
+            answer = self._request(request)
+        if answer is None:
+            return self.fallback.run_batch(path, calls)
+        if not answer.get('ok'):
+            raise EvmError(answer.get('error', 'EVM server error'))
+        return [(result.get('ok', False), result.get('error')) for result in answer['results']]
+
+    def close(self):
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._process is not None and self._process.poll() is None,
+                'calls': self.calls,
+                'fallbacks': self.fallbacks,
+                'restarts': self.restarts,
+                'timeouts': self.timeouts,
+            }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_evm_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            klass = import_string(getattr(settings, 'EVM_EXECUTOR', 'app.oraclize.SubprocessExecutor'))
+            _executor = klass()
+    return _executor
 
 
 def deployOraclizeContract(multisig_address, oraclize_address, byte_code):
-    EVM_PATH = os.path.dirname(os.path.abspath(__file__)) + '/../../go-ethereum/build/bin/evm'
-    CONTRACT_PATH = os.path.dirname(os.path.abspath(__file__)) + '/../states/' + multisig_address
-    command = EVM_PATH + ' --code ' + byte_code + ' --deploy ' + ' --read ' + \
-        CONTRACT_PATH + ' --receiver ' + oraclize_address + ' --write ' + CONTRACT_PATH
-    check_call(command, shell=True)
+    path = contract_path(multisig_address)
+    get_evm_executor().run({'code': byte_code, 'deploy': True, 'read': path,
+                            'receiver': oraclize_address, 'write': path})
+    state_cache.invalidate(multisig_address)
 
 
-def set_var_oraclize_contract(multisig_address, oraclize_address, variable):
-    EVM_PATH = os.path.dirname(os.path.abspath(__file__)) + '/../../go-ethereum/build/bin/evm'
-    CONTRACT_PATH = os.path.dirname(os.path.abspath(__file__)) + '/../states/' + multisig_address
+def set_var_input(variable):
     variable = locale.atof(variable)
     variable = hex(int(variable))[2:]
-    INPUT = '76cafced' + (64 - len(variable)) * '0' + variable
-    command = EVM_PATH + ' --read ' + CONTRACT_PATH + ' --input ' + INPUT + \
-        ' --receiver ' + oraclize_address + ' --write ' + CONTRACT_PATH
-    check_call(command, shell=True)
+    return '76cafced' + (64 - len(variable)) * '0' + variable
+
+
+def set_var_oraclize_contract(multisig_address, oraclize_address, variable):
+    path = contract_path(multisig_address)
+    get_evm_executor().run({'read': path, 'input': set_var_input(variable),
+                            'receiver': oraclize_address, 'write': path})
+    state_cache.invalidate(multisig_address)
+
+
+def set_vars_oraclize_contract(multisig_address, updates):
+    """
+    Apply `updates`, a list of (oraclize_address, value), in order to the
+    state of `multisig_address` and return a result dict per update.
+
+    The updates run on a working copy of the state file which replaces it
+    once, so readers never see a partially applied batch. The state file
+    lock is held meanwhile, so no tx is applied between the copy and the
+    rename.
+    """
+    results = [{'oraclize_address': address, 'value': value, 'succeeded': False, 'error': None}
+               for address, value in updates]
+    calls = []
+    for result in results:
+        try:
+            calls.append((result['oraclize_address'], set_var_input(result['value'])))
+        except ValueError as e:
+            result['error'] = 'Invalid value: ' + str(e)
+            calls.append(None)
+
+    batch = [call for call in calls if call is not None]
+    if not batch:
+        return results
+
+    path = contract_path(multisig_address)
+    working_path = path + '.batch'
+    # txs applied meanwhile would be lost by the rename
+    with state_file_lock(multisig_address):
+        signature = file_signature(os.stat(path))
+        shutil.copyfile(path, working_path)
+        try:
+            applied = iter(get_evm_executor().run_batch(working_path, batch))
+            for result, call in zip(results, calls):
+                if call is not None:
+                    result['succeeded'], result['error'] = next(applied)
+            if any(result['succeeded'] for result in results):
+                if file_signature(os.stat(path)) != signature:
+                    # written by a process which does not take the lock
+                    raise EvmError('State file of {} changed during the batch'.format(multisig_address))
+                os.rename(working_path, path)
+                state_cache.invalidate(multisig_address)
+        finally:
+            if os.path.exists(working_path):
+                os.remove(working_path)
+    return results
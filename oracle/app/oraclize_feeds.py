@@ -0,0 +1,190 @@
+"""
+Scheduled pushes of external values into oraclize contracts.
+
+Every enabled OraclizeFeed is polled every `interval` seconds. A polled
+value is only written when it moved by at least the feed's `threshold`
+from the last pushed value and `debounce` seconds passed since that push,
+so an unchanged value costs no EVM run. The due updates of one state file
+are applied as one batch, in the EVM worker of the state. The feeder runs
+in its own process, so the batch is ordered against the txs applied by the
+web and notification workers by the state file lock alone.
+
+Only the bookkeeping fields of a feed are saved, so an admin edit made
+during a poll, e.g. disabling the feed, is kept.
+"""
+import collections
+import datetime
+import locale
+import os
+import time
+
+import requests
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+POLL_FIELDS = ['next_poll_at', 'last_error']
+PUSH_FIELDS = POLL_FIELDS + ['last_value', 'last_pushed_at']
+
+from app import utxos as utxo_utils
+from app.evm_pool import run_for_state
+from app.models import OraclizeFeed
+from app.oraclize import contract_path, set_vars_oraclize_contract
+
+
+def poll_source(feed):
+    """
+    Return the current value of `feed` as a string.
+    """
+    if feed.source.startswith(('http://', 'https://')):
+        response = requests.get(feed.source, timeout=getattr(settings, 'ORACLIZE_FEED_TIMEOUT', 10))
+        response.raise_for_status()
+        if not feed.source_key:
+            return response.text.strip()
+        value = response.json()
+    else:
+        value = import_string(feed.source)()
+    if feed.source_key:
+        for key in feed.source_key.split('.'):
+            value = value[key]
+    return str(value)
+
+
+def skip_reason(feed, value, now):
+    """
+    Return why `value` is not worth writing to `feed`, or None.
+    """
+    if not feed.last_value:
+        return None
+    change = abs(locale.atof(value) - locale.atof(feed.last_value))
+    if change == 0 or change < feed.threshold:
+        return 'threshold'
+    if feed.last_pushed_at and (now - feed.last_pushed_at).total_seconds() < feed.debounce:
+        return 'debounce'
+    return None
+
+
+def _poll(feed):
+    try:
+        value = poll_source(feed)
+        locale.atof(value)
+        return value, None
+    except Exception as e:
+        return None, '{}: {}'.format(type(e).__name__, e)
+
+
+class FeedScheduler(object):
+
+    def __init__(self):
+        self.polls = 0
+        self.poll_failures = 0
+        self.skipped_threshold = 0
+        self.skipped_debounce = 0
+        self.applied = 0
+        self.failed = 0
+        self.batches = 0
+        self.state_writes = 0
+        self.bytes_written = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def due_feeds(self, now):
+        return list(OraclizeFeed.objects.filter(enabled=True).filter(
+            Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now)).select_related('oraclize_contract'))
+
+    def run_due(self, now=None):
+        """
+        Poll the due feeds, write the values worth it and return how many
+        updates were applied.
+        """
+        now = now or timezone.now()
+        feeds = self.due_feeds(now)
+        if not feeds:
+            return 0
+
+        polled_at = time.time()
+        batches = collections.OrderedDict()
+        for feed, (value, error) in zip(feeds, utxo_utils.get_executor().map(_poll, feeds)):
+            self.polls += 1
+            feed.next_poll_at = now + datetime.timedelta(seconds=feed.interval)
+            if error is not None:
+                self.poll_failures += 1
+                feed.last_error = error
+                feed.save(update_fields=POLL_FIELDS)
+                continue
+
+            reason = skip_reason(feed, value, now)
+            if reason is not None:
+                if reason == 'threshold':
+                    self.skipped_threshold += 1
+                else:
+                    self.skipped_debounce += 1
+                feed.save(update_fields=['next_poll_at'])
+                continue
+            batches.setdefault(feed.multisig_address, []).append((feed, value))
+
+        applied = 0
+        for multisig_address, due in batches.items():
+            applied += self.apply(multisig_address, due, polled_at)
+        return applied
+
+    def apply(self, multisig_address, due, polled_at):
+        updates = [(feed.oraclize_contract.address, value) for feed, value in due]
+        try:
+            results = run_for_state(multisig_address, set_vars_oraclize_contract, multisig_address, updates)
+        except Exception as e:
+            results = [{'succeeded': False, 'error': '{}: {}'.format(type(e).__name__, e)} for _ in due]
+        latency = time.time() - polled_at
+
+        self.batches += 1
+        if any(result['succeeded'] for result in results):
+            self.state_writes += 1
+            try:
+                self.bytes_written += os.path.getsize(contract_path(multisig_address))
+            except OSError:
+                pass
+
+        applied = 0
+        for (feed, value), result in zip(due, results):
+            if result['succeeded']:
+                feed.last_value = value
+                feed.last_pushed_at = timezone.now()
+                feed.last_error = ''
+                applied += 1
+                self.latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            else:
+                feed.last_error = result['error'] or ''
+                self.failed += 1
+            feed.save(update_fields=PUSH_FIELDS)
+        self.applied += applied
+        return applied
+
+    def next_poll_delay(self, now=None):
+        """
+        Return the seconds until the next feed is due, or None without feeds.
+        """
+        now = now or timezone.now()
+        feed = OraclizeFeed.objects.filter(enabled=True).order_by('next_poll_at').first()
+        if feed is None:
+            return None
+        if feed.next_poll_at is None:
+            return 0.0
+        return max(0.0, (feed.next_poll_at - now).total_seconds())
+
+    def stats(self):
+        return {
+            'polls': self.polls,
+            'poll_failures': self.poll_failures,
+            'skipped_threshold': self.skipped_threshold,
+            'skipped_debounce': self.skipped_debounce,
+            'applied': self.applied,
+            'failed': self.failed,
+            'batches': self.batches,
+            'state_writes': self.state_writes,
+            'writes_per_update': self.state_writes / self.applied if self.applied else 0.0,
+            'bytes_per_update': self.bytes_written / self.applied if self.applied else 0.0,
+            'avg_latency': self.latency / self.applied if self.applied else 0.0,
+            'max_latency': self.max_latency,
+        }
@@ -1,6 +1,16 @@
-from django.http import JsonResponse
+import os
+import re
+
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from django.utils.text import compress_sequence
 from rest_framework.views import status
 
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+FILE_CHUNK_SIZE = 64 * 1024
+
 
 def data_response(data):
     response = {
@@ -9,7 +19,7 @@ def data_response(data):
     return JsonResponse(response, status=status.HTTP_200_OK)
 
 
-def error_response(http_code, message="", error_code=""):
+def error_data(http_code, message="", error_code=""):
     if error_code == "":
         error_code = http_code
     response = {
@@ -20,4 +30,58 @@ def error_response(http_code, message="", error_code=""):
             }
         ]
     }
-    return JsonResponse(response, status=http_code)
+    return response, http_code
+
+
+def error_response(http_code, message="", error_code=""):
+    response, status = error_data(http_code, message, error_code)
+    return JsonResponse(response, status=status)
+
+
+def _read_chunks(f):
+    try:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), b''):
+            yield chunk
+    finally:
+        f.close()
+
+
+def _is_not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and int(mtime) <= if_modified_since
+    return False
+
+
+def file_response(request, f, content_type):
+    """
+    Stream an opened binary file without loading it into memory.
+
+    The ETag is derived from the file's inode, mtime and size, so polling
+    clients get 304 Not Modified until the file is rewritten. The body is
+    gzip-compressed on the fly when the client accepts it.
+    """
+    stat = os.fstat(f.fileno())
+    gzipped = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    etag = '{:x}-{:x}-{:x}'.format(stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if gzipped:
+        etag += '-gzip'
+
+    if _is_not_modified(request, etag, stat.st_mtime):
+        f.close()
+        response = HttpResponseNotModified()
+    elif gzipped:
+        response = StreamingHttpResponse(compress_sequence(_read_chunks(f)), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = FileResponse(f, content_type=content_type)
+
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,71 @@
+"""
+Cache of signatures handed out by Sign.
+
+Cosigner clients retry Sign with the same request after timeouts. A retry
+gets the earlier signature back as long as the oldest utxo and the state
+version it was validated against are still current.
+"""
+import collections
+import hashlib
+import threading
+
+from django.conf import settings
+
+_Entry = collections.namedtuple('_Entry', ['signature', 'old_utxo', 'state_version'])
+
+
+class SignatureCache(object):
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(raw_tx, input_index, script, public_key, contract_address=None):
+        message = '\n'.join([raw_tx, str(input_index), script, public_key, contract_address or ''])
+        return hashlib.sha256(message.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, old_utxo, state_version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.old_utxo != old_utxo or entry.state_version != state_version:
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.signature
+
+    def set(self, key, signature, old_utxo, state_version):
+        with self._lock:
+            self._entries[key] = _Entry(signature, old_utxo, state_version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+signature_cache = SignatureCache(getattr(settings, 'SIGNATURE_CACHE_MAX_ENTRIES', 10000))
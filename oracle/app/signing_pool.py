@@ -0,0 +1,138 @@
+"""
+Pool of signing worker processes.
+
+Signing in the request thread holds the GIL, so one oracle process signs on
+one core. With `SIGNING_WORKERS` > 0 the sign views hand their inputs to a
+pool of forked worker processes instead. Each worker keeps its own copy of
+the keyring, so a job only carries the multisig address and the public key
+it expects the worker to sign with. Jobs travel to the workers in chunks
+over the pool's pipes.
+"""
+import multiprocessing
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from app.keyring import keyring
+from gcoinbackend.signers import get_signer
+
+
+class SigningTimeout(Exception):
+    pass
+
+
+def close_connections():
+    # forked workers must not share the parent's database sockets
+    for connection in connections.all():
+        connection.close()
+
+
+def _get_key(multisig_address, public_key):
+    key = keyring.get(multisig_address)
+    if key.public_key != public_key:
+        # the key changed in the parent after this worker was forked
+        keyring.invalidate()
+        key = keyring.get(multisig_address)
+    return key
+
+
+def _sign_chunk(jobs, deadline):
+    if time.time() > deadline:
+        # the request gave up waiting, the pool cannot cancel queued chunks
+        return None
+    signer = get_signer()
+    signatures = []
+    for multisig_address, public_key, tx, input_index, script in jobs:
+        key = _get_key(multisig_address, public_key)
+        signatures.append(signer.multisign(tx, input_index, script, key.private_key))
+    return signatures
+
+
+class SigningPool(object):
+
+    def __init__(self, workers, timeout=10):
+        self.workers = workers
+        self.timeout = timeout
+        self.pending = 0
+        self.max_pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        close_connections()
+        self._pool = multiprocessing.Pool(workers)
+
+    def sign(self, jobs):
+        """
+        Sign `jobs`, a list of (multisig_address, public_key, tx, input_index,
+        script), and return the signatures in the same order.
+
+        Raises SigningTimeout when the workers did not sign every job within
+        the timeout; chunks not started by then are skipped.
+        """
+        size = -(-len(jobs) // self.workers)
+        chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+
+        with self._lock:
+            self.pending += len(jobs)
+            self.max_pending = max(self.max_pending, self.pending)
+            self.submitted += len(jobs)
+
+        succeeded = False
+        deadline = time.time() + self.timeout
+        try:
+            results = [self._pool.apply_async(_sign_chunk, (chunk, deadline)) for chunk in chunks]
+            signatures = []
+            for result in results:
+                # one deadline for the whole request, not one per chunk
+                chunk_signatures = result.get(max(0, deadline - time.time()))
+                if chunk_signatures is None:
+                    raise SigningTimeout()
+                signatures.extend(chunk_signatures)
+            succeeded = True
+            return signatures
+        except multiprocessing.TimeoutError:
+            raise SigningTimeout()
+        finally:
+            with self._lock:
+                self.pending -= len(jobs)
+                if succeeded:
+                    self.completed += len(jobs)
+                else:
+                    self.failed += len(jobs)
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_depth': self.pending,
+                'max_queue_depth': self.max_pending,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+
+
+_signing_pool = None
+_signing_pool_lock = threading.Lock()
+
+
+def get_signing_pool():
+    """
+    Return the process-wide SigningPool, or None when `SIGNING_WORKERS` is 0
+    and signatures are computed inline.
+    """
+    global _signing_pool
+    workers = getattr(settings, 'SIGNING_WORKERS', 0)
+    if not workers:
+        return None
+    with _signing_pool_lock:
+        if _signing_pool is None:
+            _signing_pool = SigningPool(workers, getattr(settings, 'SIGNING_TIMEOUT', 10))
+    return _signing_pool
@@ -0,0 +1,169 @@
+"""
+In-process cache of parsed contract state files.
+
+Every read view used to ``json.load`` the whole ``states/<multisig_address>``
+file per request. ``StateCache`` keeps the parsed documents in memory and
+only re-parses a file when its inode, mtime or size changed, or when the
+state was explicitly invalidated after ``evm_deploy`` applied a transaction.
+
+The cached documents are shared between requests and must be treated as
+read-only by callers.
+"""
+import collections
+import contextlib
+import fcntl
+import json
+import os
+import threading
+
+from django.conf import settings
+
+EVM_PATH = '../oracle/states/{multisig_address}'
+
+
+def state_path(multisig_address):
+    return EVM_PATH.format(multisig_address=multisig_address)
+
+
+@contextlib.contextmanager
+def state_file_lock(multisig_address):
+    """
+    Hold the exclusive lock of the state file of `multisig_address`, shared
+    by all the processes writing it. The lock is taken on a hidden sibling
+    file since writers replace the state file itself.
+    """
+    path = state_path(multisig_address)
+    lock_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.lock')
+    with open(lock_path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def file_signature(stat):
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def state_version(multisig_address):
+    """
+    Return an opaque value that changes whenever the state file is rewritten.
+    """
+    return '{:x}-{:x}-{:x}'.format(*file_signature(os.stat(state_path(multisig_address))))
+
+
+_Entry = collections.namedtuple('_Entry', ['signature', 'content', 'size', 'derived'])
+
+
+class StateCache(object):
+    """
+    LRU cache of parsed state documents keyed by multisig address.
+
+    The byte budget is measured with the on-disk size of the state files.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._versions = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, multisig_address):
+        """
+        Return the parsed state document of `multisig_address`.
+
+        Raises IOError when the state file does not exist.
+        """
+        path = state_path(multisig_address)
+        signature = file_signature(os.stat(path)) + (self._versions[multisig_address],)
+        with self._lock:
+            entry = self._entries.get(multisig_address)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(multisig_address)
+                self.hits += 1
+                return entry.content
+            self.misses += 1
+
+        with open(path, 'r') as f:
+            # take the signature from the opened file so that a concurrent
+            # rewrite can only make the entry look stale, never fresh
+            stat = os.fstat(f.fileno())
+            version = self._versions[multisig_address]
+            content = json.load(f)
+
+        self._store(multisig_address, file_signature(stat) + (version,), content, stat.st_size)
+        return content
+
+    def get_derived(self, multisig_address, key, builder):
+        """
+        Return `builder(content)` for the current state document, memoized
+        alongside the cached document under `key`.
+        """
+        content = self.get(multisig_address)
+        with self._lock:
+            entry = self._entries.get(multisig_address)
+            if entry is None or entry.content is not content:
+                entry = None
+            elif key in entry.derived:
+                return entry.derived[key]
+
+        value = builder(content)
+        if entry is not None:
+            with self._lock:
+                entry.derived[key] = value
+        return value
+
+    def invalidate(self, multisig_address):
+        """
+        Drop the cached document and bump the state version so that documents
+        parsed before the invalidation are never stored.
+        """
+        with self._lock:
+            self._versions[multisig_address] += 1
+            self._discard(multisig_address)
+
+    def clear(self):
+        with self._lock:
+            for multisig_address in list(self._entries):
+                self._versions[multisig_address] += 1
+                self._discard(multisig_address)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _store(self, multisig_address, signature, content, size):
+        with self._lock:
+            if signature[-1] != self._versions[multisig_address]:
+                return
+            self._discard(multisig_address)
+            if size > self.max_bytes:
+                return
+            self._entries[multisig_address] = _Entry(signature, content, size, {})
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+                self.evictions += 1
+
+    def _discard(self, multisig_address):
+        entry = self._entries.pop(multisig_address, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+
+state_cache = StateCache(getattr(settings, 'STATE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
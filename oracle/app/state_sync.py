@@ -0,0 +1,237 @@
+"""
+Background synchronisation of the contract state files.
+
+Txs are applied to a state file only here, serialized per multisig address
+by the state file lock, and every applied tx is recorded in the
+StateTransaction ledger under the next version of its state. Notifications
+apply txs as they arrive. Sign only waits until the tx it depends on is in
+the ledger: if the state is behind, it asks the synchroniser to advance in
+the background and waits for it with a deadline, so a request never
+replays txs itself.
+"""
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from app import holdings
+from app.evm_pool import run_for_state
+from app.models import StateTransaction
+from app.state_cache import state_cache, state_file_lock
+from smart_contract_utils.ContractStateFileUpdater import ContractStateFileUpdater
+
+# how often waiters re-read the ledger for txs applied by other processes
+POLL_INTERVAL = 0.2
+
+
+class StateSyncError(Exception):
+    pass
+
+
+def state_updated(multisig_address):
+    state_cache.invalidate(multisig_address)
+    try:
+        holdings.index_state(multisig_address)
+    except Exception as e:
+        print('Index holdings failed: ' + str(e))
+
+
+def applied_version(multisig_address):
+    """
+    Return the version of the last tx applied to the state, 0 if none.
+    """
+    version = StateTransaction.objects.filter(
+        multisig_address=multisig_address).aggregate(Max('version'))['version__max']
+    return version or 0
+
+
+def is_applied(multisig_address, tx_hash):
+    return StateTransaction.objects.filter(multisig_address=multisig_address, tx_hash=tx_hash).exists()
+
+
+def is_processed(tx_hash):
+    """
+    Return whether `tx_hash` has been applied to any state.
+    """
+    return StateTransaction.objects.filter(tx_hash=tx_hash).exists()
+
+
+def record_applied(multisig_address, tx_hash):
+    """
+    Add `tx_hash` to the ledger and return its version.
+    """
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                entry = StateTransaction.objects.filter(multisig_address=multisig_address, tx_hash=tx_hash).first()
+                if entry is not None:
+                    return entry.version
+                version = applied_version(multisig_address) + 1
+                StateTransaction.objects.create(multisig_address=multisig_address, tx_hash=tx_hash, version=version)
+                return version
+        except IntegrityError:
+            # another process recorded a tx concurrently
+            continue
+    raise StateSyncError('Cannot record {} for {}'.format(tx_hash, multisig_address))
+
+
+class StateSynchroniser(object):
+
+    def __init__(self):
+        self.applied = 0
+        self.batches = 0
+        self.failed = 0
+        self.waits = 0
+        self.wait_timeouts = 0
+        self._lock = threading.Lock()
+        self._address_locks = collections.defaultdict(threading.Lock)
+        self._conditions = collections.defaultdict(threading.Condition)
+        self._in_flight = set()
+        self._failures = {}
+
+    def apply_batch(self, multisig_address, tx_hashes, update_tx):
+        """
+        Apply `tx_hashes` in order with `update_tx(tx_hash)`, which returns
+        whether the tx was applied. Every applied tx is checkpointed in the
+        ledger at once, so a batch which fails part-way resumes after its
+        last applied tx; the cache and the holdings index are refreshed once
+        for the whole batch.
+
+        Returns whether every tx of the batch is applied.
+        """
+        with self._lock:
+            address_lock = self._address_locks[multisig_address]
+            self.batches += 1
+        applied = 0
+        attempted = False
+        completed = True
+        # oraclize batches rewrite the file from other processes
+        with address_lock, state_file_lock(multisig_address):
+            try:
+                for tx_hash in tx_hashes:
+                    if is_applied(multisig_address, tx_hash):
+                        continue
+                    attempted = True
+                    if not update_tx(tx_hash):
+                        # later txs depend on this one
+                        completed = False
+                        break
+                    record_applied(multisig_address, tx_hash)
+                    applied += 1
+            finally:
+                with self._lock:
+                    self.applied += applied
+                if attempted:
+                    state_updated(multisig_address)
+        self._notify(multisig_address)
+        return completed
+
+    def advance(self, multisig_address, tx_hash):
+        """
+        Replay the txs of the state up to `tx_hash`, recording every tx
+        applied on the way in the ledger.
+        """
+        # catchup imports this module
+        from app.catchup import txs_until
+
+        try:
+            run_for_state(multisig_address, replay_txs, multisig_address, txs_until(multisig_address, tx_hash))
+            # the file may have been rewritten by an EVM worker
+            state_cache.invalidate(multisig_address)
+        except Exception as e:
+            print('Advance state {} to {} failed: {}'.format(multisig_address, tx_hash, e))
+            with self._lock:
+                self.failed += 1
+                self._failures[(multisig_address, tx_hash)] = str(e)
+            self._notify(multisig_address)
+        finally:
+            with self._lock:
+                self._in_flight.discard((multisig_address, tx_hash))
+
+    def schedule(self, multisig_address, tx_hash):
+        """
+        Advance the state to `tx_hash` in a background thread, once, or in
+        the calling thread with `RUN_BACKGROUND_TASKS_INLINE`.
+        """
+        with self._lock:
+            if (multisig_address, tx_hash) in self._in_flight:
+                return
+            self._in_flight.add((multisig_address, tx_hash))
+        if getattr(settings, 'RUN_BACKGROUND_TASKS_INLINE', False):
+            self.advance(multisig_address, tx_hash)
+            return
+        t = threading.Thread(target=self.advance, args=[multisig_address, tx_hash])
+        t.daemon = True
+        t.start()
+
+    def wait_for_tx(self, multisig_address, tx_hash, timeout):
+        """
+        Wait until `tx_hash` has been applied to the state.
+
+        Returns False when it is still pending after `timeout` seconds and
+        raises StateSyncError when the background advance failed.
+        """
+        if is_applied(multisig_address, tx_hash):
+            return True
+
+        with self._lock:
+            self.waits += 1
+            # a failed advance is retried by the next request
+            self._failures.pop((multisig_address, tx_hash), None)
+            condition = self._conditions[multisig_address]
+        self.schedule(multisig_address, tx_hash)
+
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                error = self._failures.get((multisig_address, tx_hash))
+            if error is not None:
+                raise StateSyncError(error)
+            if is_applied(multisig_address, tx_hash):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                with self._lock:
+                    self.wait_timeouts += 1
+                return False
+            with condition:
+                condition.wait(min(remaining, POLL_INTERVAL))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'applied': self.applied,
+                'batches': self.batches,
+                'failed': self.failed,
+                'in_flight': len(self._in_flight),
+                'waits': self.waits,
+                'wait_timeouts': self.wait_timeouts,
+            }
+
+    def _notify(self, multisig_address):
+        with self._lock:
+            condition = self._conditions[multisig_address]
+        with condition:
+            condition.notify_all()
+
+
+state_sync = StateSynchroniser()
+
+
+def replay_txs(multisig_address, tx_hashes):
+    """
+    Replay the txs of the state up to each of `tx_hashes`, in order.
+    """
+    def update_tx(tx_hash):
+        ContractStateFileUpdater(multisig_address).update_until_tx(tx_hash)
+        return True
+
+    return state_sync.apply_batch(multisig_address, tx_hashes, update_tx)
+
+
+def last_applied_tx(multisig_address):
+    entry = StateTransaction.objects.filter(multisig_address=multisig_address).order_by('-version').first()
+    return entry.tx_hash if entry else None
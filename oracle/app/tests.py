@@ -1,13 +1,40 @@
+import asyncio
+import concurrent.futures
+import datetime
+import gzip
 import json
 import mock
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 try:
     import http.client as httplib
 except ImportError:
     import httplib
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
-from app.models import Proposal
+from app import catchup, holdings, jobs, oraclize, views
+from app.chain_follower import ChainFollower, start_at
+from app.dispatcher import Dispatcher, QueueFull
+from app.evm_pool import EvmPool, EvmWorkerError
+from app import utxos as utxo_utils
+from app.keyring import SigningKey, keyring
+from app.oraclize_feeds import FeedScheduler
+from app.signature_cache import SignatureCache
+from app.signing_pool import SigningPool, SigningTimeout
+from app.models import (AddressHolding, ChainCursor, Keystore, NotificationJob, OraclizeContract, OraclizeFeed,
+                        Proposal, StateLock, StateTransaction, StateUtxo)
+from app.state_cache import StateCache
+from app.state_sync import StateSynchroniser, StateSyncError, record_applied
+from gcoinbackend import core as gcoincore
+from gcoinbackend.cache import ChainCache
+from gcoinbackend.signers import GcoinSigner, Secp256k1Signer
 
 API_VERSION = '/api/v1'
 
@@ -93,6 +120,7 @@ class MultisigAddrTest(TestCase):
         self.assertEqual(response.status_code, httplib.BAD_REQUEST)
 
 
+@override_settings(RUN_BACKGROUND_TASKS_INLINE=True)
 class AddressNotifiedCase(TestCase):
 
     def setUp(self):
@@ -118,3 +146,1347 @@ class AddressNotifiedCase(TestCase):
     def test_address_notified(self):
         self.response = self.client.post(self.url, self.sample_form)
         self.assertEqual(self.response.status_code, httplib.OK)
+
+
+class StateFileTestCase(TestCase):
+    """
+    Serve the state files from a temporary directory holding a copy of
+    test_state_file for 3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7.
+    """
+
+    def setUp(self):
+        super(StateFileTestCase, self).setUp()
+        self.state_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch('app.state_cache.EVM_PATH',
+                                  os.path.join(self.state_dir, '{multisig_address}'))
+        self.patcher.start()
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'test_files', 'test_state_file'),
+                    os.path.join(self.state_dir, '3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7'))
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.state_dir)
+        super(StateFileTestCase, self).tearDown()
+
+    def write_state(self, multisig_address, content):
+        with open(os.path.join(self.state_dir, multisig_address), 'w') as f:
+            json.dump(content, f)
+
+
+class StateCacheTest(StateFileTestCase):
+
+    def setUp(self):
+        super(StateCacheTest, self).setUp()
+        self.write_state('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7', {'accounts': {}})
+
+    def test_cache_hit(self):
+        cache = StateCache(max_bytes=1024)
+        cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        content = cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        self.assertEqual(content, {'accounts': {}})
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_rewritten_file_is_reloaded(self):
+        cache = StateCache(max_bytes=1024)
+        cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        self.write_state('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7', {'accounts': {'aa': {}}})
+        content = cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        self.assertEqual(content, {'accounts': {'aa': {}}})
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_invalidate(self):
+        cache = StateCache(max_bytes=1024)
+        cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        cache.invalidate('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_lru_eviction(self):
+        self.write_state('36Q4vWxZ8co2h2UviEudacMwFadqL4TtBw', {'accounts': {}})
+        cache = StateCache(max_bytes=20)
+        cache.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        cache.get('36Q4vWxZ8co2h2UviEudacMwFadqL4TtBw')
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['evictions'], 1)
+
+    def test_missing_state(self):
+        cache = StateCache(max_bytes=1024)
+        with self.assertRaises(IOError):
+            cache.get('34Qk88LLP4y4wRWDCCifJBujMA2CKkBUgh')
+
+
+class DumpContractStateTest(StateFileTestCase):
+
+    def setUp(self):
+        super(DumpContractStateTest, self).setUp()
+        self.url = API_VERSION + '/states/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7/'
+
+    def test_dump_state(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, httplib.OK)
+        data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertIn('accounts', data)
+
+    def test_dump_missing_state(self):
+        response = self.client.get(API_VERSION + '/states/34Qk88LLP4y4wRWDCCifJBujMA2CKkBUgh/')
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, httplib.NOT_MODIFIED)
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertIn('accounts', json.loads(content.decode('utf-8')))
+
+
+class GetBalancesTest(StateFileTestCase):
+
+    def setUp(self):
+        super(GetBalancesTest, self).setUp()
+        self.url = API_VERSION + '/balances/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7/'
+
+    def test_get_balances(self):
+        sample_form = {
+            'evm_addresses': str(['ad07c94ce95ac2f968b031753faefdb8197701e9',
+                                  '0000000000000000000000000000000000000001']),
+        }
+        response = self.client.post(self.url, sample_form)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(data['balances'], {'ad07c94ce95ac2f968b031753faefdb8197701e9': {'0': '0', '1': '5'}})
+        self.assertEqual(data['not_found'], ['0000000000000000000000000000000000000001'])
+
+    @mock.patch('app.views.wallet_address_to_evm', lambda address: 'ad07c94ce95ac2f968b031753faefdb8197701e9')
+    def test_get_balances_by_wallet_address(self):
+        sample_form = {
+            'addresses': str(['1GJmDFXnkG1TzFk9wqq5dfBbH3z9sNKkrL']),
+        }
+        response = self.client.post(self.url, sample_form)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['balances'], {'1GJmDFXnkG1TzFk9wqq5dfBbH3z9sNKkrL': {'0': '0', '1': '5'}})
+
+    def test_empty_address_list(self):
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+
+    def test_missing_state(self):
+        sample_form = {
+            'evm_addresses': str(['ad07c94ce95ac2f968b031753faefdb8197701e9']),
+        }
+        response = self.client.post(API_VERSION + '/balances/34Qk88LLP4y4wRWDCCifJBujMA2CKkBUgh/', sample_form)
+        self.assertEqual(response.status_code, httplib.NOT_FOUND)
+
+
+class HoldingsTest(StateFileTestCase):
+
+    def test_index_state(self):
+        holdings.index_state('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        # accounts holding nothing are not indexed
+        self.assertEqual(AddressHolding.objects.count(), 1)
+        self.assertEqual(holdings.get_holdings('ad07c94ce95ac2f968b031753faefdb8197701e9'),
+                         {'3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7': {'0': '0', '1': '5'}})
+
+    def test_rebuild_index_drops_removed_states(self):
+        AddressHolding.objects.create(evm_address='ad07c94ce95ac2f968b031753faefdb8197701e9',
+                                      multisig_address='34Qk88LLP4y4wRWDCCifJBujMA2CKkBUgh',
+                                      balance='{"1": "1"}')
+        indexed, failed = holdings.rebuild_index()
+        self.assertEqual(indexed, ['3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7'])
+        self.assertEqual(failed, [])
+        self.assertFalse(AddressHolding.objects.filter(
+            multisig_address='34Qk88LLP4y4wRWDCCifJBujMA2CKkBUgh').exists())
+
+    @mock.patch('app.views.wallet_address_to_evm', lambda address: 'ad07c94ce95ac2f968b031753faefdb8197701e9')
+    def test_get_holdings(self):
+        holdings.index_state('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        response = self.client.get(API_VERSION + '/holdings/1GJmDFXnkG1TzFk9wqq5dfBbH3z9sNKkrL/')
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(data['holdings'], {'3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7': {'0': '0', '1': '5'}})
+
+
+@mock.patch('app.views.wallet_address_to_evm', lambda address: 'e8a4373d99ed09f9e44454f016ca30a1d2184dd1')
+class GetStorageTest(StateFileTestCase):
+
+    def setUp(self):
+        super(GetStorageTest, self).setUp()
+        self.url = API_VERSION + '/storage/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7/'
+
+    def get(self, params=None):
+        response = self.client.get(self.url, params or {})
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def test_full_storage(self):
+        status_code, data = self.get()
+        self.assertEqual(status_code, httplib.OK)
+        self.assertEqual(len(data), 9)
+
+    def test_pagination(self):
+        status_code, data = self.get({'limit': 5})
+        self.assertEqual(len(data['storage']), 5)
+        status_code, data = self.get({'limit': 5, 'cursor': data['next_cursor']})
+        self.assertEqual(len(data['storage']), 4)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_prefix(self):
+        status_code, data = self.get({'prefix': 'cd'})
+        self.assertEqual(list(data['storage']), ['cd5c931c56d88b512b4e0cfa38bb1cb96803376b124315c04ef71e26669cf7d7'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_keys(self):
+        status_code, data = self.get({'keys': '0000000000000000000000000000000000000000000000000000000000000001,ff'})
+        self.assertEqual(list(data['storage']), ['0000000000000000000000000000000000000000000000000000000000000001'])
+        self.assertEqual(data['not_found'], ['ff'])
+
+    def test_invalid_limit(self):
+        status_code, data = self.get({'limit': 0})
+        self.assertEqual(status_code, httplib.BAD_REQUEST)
+
+
+class ChainCacheTest(TestCase):
+
+    def setUp(self):
+        self.backend = mock.Mock()
+        self.patchers = [
+            mock.patch('gcoinbackend.core.get_gcoin_backend', return_value=self.backend),
+            mock.patch('gcoinbackend.core._chain_cache', ChainCache()),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_confirmed_tx_is_cached(self):
+        self.backend.get_tx.return_value = {'txid': 'aa', 'blockhash': 'bb', 'confirmations': 3}
+        gcoincore.get_tx('aa')
+        tx = gcoincore.get_tx('aa')
+        self.assertEqual(tx['blockhash'], 'bb')
+        self.assertEqual(self.backend.get_tx.call_count, 1)
+
+    def test_unconfirmed_tx_is_not_cached(self):
+        self.backend.get_tx.return_value = {'txid': 'cc', 'confirmations': 0}
+        gcoincore.get_tx('cc')
+        gcoincore.get_tx('cc')
+        self.assertEqual(self.backend.get_tx.call_count, 2)
+
+    def test_tx_without_confirmations_is_not_cached(self):
+        self.backend.get_tx.return_value = {'txid': 'dd'}
+        gcoincore.get_tx('dd')
+        gcoincore.get_tx('dd')
+        self.assertEqual(self.backend.get_tx.call_count, 2)
+
+    def test_confirmed_block_header_is_cached(self):
+        self.backend.get_block_by_hash.return_value = {
+            'hash': 'bb', 'time': 1, 'height': 2, 'previousblockhash': 'aa',
+            'nextblockhash': 'cc', 'confirmations': 1, 'tx': ['dd']}
+        gcoincore.get_block_header('bb')
+        header = gcoincore.get_block_header('bb')
+        self.assertEqual(header, {'hash': 'bb', 'time': 1, 'height': 2, 'previousblockhash': 'aa'})
+        self.assertEqual(self.backend.get_block_by_hash.call_count, 1)
+
+    def test_whole_block_is_not_cached(self):
+        self.backend.get_block_by_hash.return_value = {'hash': 'bb', 'time': 1, 'height': 2, 'confirmations': 1}
+        gcoincore.get_block_by_hash('bb')
+        gcoincore.get_block_by_hash('bb')
+        self.assertEqual(self.backend.get_block_by_hash.call_count, 2)
+
+    def test_persists_across_restarts(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(cache_dir, 'chain.sqlite')
+            ChainCache(path).set('block', 'bb', {'time': 1})
+            cache = ChainCache(path)
+            self.assertEqual(cache.get('block', 'bb'), {'time': 1})
+            self.assertEqual(cache.disk_hits, 1)
+
+            cache.set('block', 'bb', {'time': 2})
+            self.assertEqual(ChainCache(path).get('block', 'bb'), {'time': 2})
+        finally:
+            shutil.rmtree(cache_dir)
+
+
+class StateUtxoTest(TestCase):
+
+    def setUp(self):
+        self.multisig_address = '3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7'
+        StateUtxo.objects.create(multisig_address=self.multisig_address, txid='aa', vout=0, block_time=100)
+        StateUtxo.objects.create(multisig_address=self.multisig_address, txid='bb', vout=1, block_time=50)
+
+    def test_oldest_utxo(self):
+        old_utxo, all_utxos = utxo_utils.get_state_utxos(self.multisig_address)
+        self.assertEqual(old_utxo, ('bb', 1))
+        self.assertEqual(set(all_utxos), set([('aa', 0), ('bb', 1)]))
+
+    @mock.patch('gcoinbackend.core.get_tx')
+    def test_apply_tx(self, get_tx):
+        get_tx.return_value = {
+            'txid': 'cc',
+            'blockhash': 'dd',
+            'blocktime': 200,
+            'vin': [{'txid': 'bb', 'vout': 1}],
+            'vout': [
+                {'n': 0, 'scriptPubKey': {'addresses': [self.multisig_address]}},
+                {'n': 1, 'scriptPubKey': {'addresses': ['1GJmDFXnkG1TzFk9wqq5dfBbH3z9sNKkrL']}},
+            ],
+        }
+        utxo_utils.apply_tx(self.multisig_address, 'cc')
+        old_utxo, all_utxos = utxo_utils.get_state_utxos(self.multisig_address)
+        self.assertEqual(old_utxo, ('aa', 0))
+        self.assertEqual(set(all_utxos), set([('aa', 0), ('cc', 0)]))
+
+    @mock.patch('app.utxos.resolve_block_times', return_value=({('ee', 0): 10}, {}))
+    @mock.patch('gcoinbackend.core.get_address_utxos', return_value=[{'txid': 'ee', 'vout': 0}])
+    def test_reconcile(self, get_address_utxos, resolve_block_times):
+        old_utxo, all_utxos = utxo_utils.get_state_utxos(self.multisig_address, refresh=True)
+        self.assertEqual(old_utxo, ('ee', 0))
+        self.assertEqual(all_utxos, [('ee', 0)])
+
+    def test_lookup_timeout_keeps_shared_executor(self):
+        release = threading.Event()
+
+        def get_block_time(txid):
+            release.wait(10)
+            return 10
+
+        with mock.patch('app.utxos._executor', concurrent.futures.ThreadPoolExecutor(1)), \
+                mock.patch('app.utxos._lookup_executor', concurrent.futures.ThreadPoolExecutor(1)), \
+                mock.patch('app.utxos.get_block_time', get_block_time):
+            try:
+                block_times, failures = utxo_utils.resolve_block_times([{'txid': 'ff', 'vout': 0}], timeout=0.1)
+                self.assertEqual(failures, {('ff', 0): utxo_utils.TIMEOUT})
+                # the lookup still runs, the chain follower and the feeds are not blocked
+                self.assertEqual(utxo_utils.get_executor().submit(int, '1').result(timeout=1), 1)
+            finally:
+                release.set()
+
+
+class BatchSignTest(TestCase):
+
+    def setUp(self):
+        self.url = API_VERSION + '/batchsign/'
+        self.sample_form = {
+            'raw_tx': '0100',
+            'inputs': json.dumps([{'input_index': 0, 'script': '52ae'},
+                                  {'input_index': 1, 'script': '52ae'}]),
+            'state_multisig_address': '3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7',
+        }
+
+    @mock.patch('gcoinbackend.signers.GcoinSigner.multisign',
+                lambda self, tx, input_index, script, private_key: 'sig{}'.format(input_index))
+    @mock.patch('app.views.Sign.get_private_key', return_value='00' * 32)
+    @mock.patch('app.views.Sign.validate_tx', return_value=None)
+    @mock.patch('app.views.deserialize', return_value={'ins': [{}, {}], 'outs': []})
+    def test_batch_sign(self, deserialize, validate_tx, get_private_key):
+        response = self.client.post(self.url, self.sample_form)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(response.status_code, httplib.OK)
+        self.assertEqual(data['signatures'], [{'input_index': 0, 'signature': 'sig0'},
+                                              {'input_index': 1, 'signature': 'sig1'}])
+        self.assertEqual(validate_tx.call_count, 1)
+
+    @mock.patch('app.views.deserialize', return_value={'ins': [{}], 'outs': []})
+    def test_input_index_out_of_range(self, deserialize):
+        response = self.client.post(self.url, self.sample_form)
+        self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+
+    def test_duplicated_input_index(self):
+        self.sample_form['inputs'] = json.dumps([{'input_index': 0, 'script': '52ae'},
+                                                 {'input_index': 0, 'script': '52ae'}])
+        response = self.client.post(self.url, self.sample_form)
+        self.assertEqual(response.status_code, httplib.BAD_REQUEST)
+
+
+class KeyringTest(TestCase):
+
+    def setUp(self):
+        self.keystore = Keystore.objects.create_new_keypair()
+        Proposal.objects.create(public_key=self.keystore.public_key,
+                                multisig_address='3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+
+    def test_get_key_without_queries(self):
+        keyring.load()
+        with self.assertNumQueries(0):
+            key = keyring.get('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        self.assertEqual(key.public_key, self.keystore.public_key)
+        self.assertEqual(key.private_key, int(self.keystore.private_key, 16))
+
+    def test_new_proposal_invalidates_keyring(self):
+        keyring.load()
+        Proposal.objects.create(public_key=self.keystore.public_key,
+                                multisig_address='36Q4vWxZ8co2h2UviEudacMwFadqL4TtBw')
+        key = keyring.get('36Q4vWxZ8co2h2UviEudacMwFadqL4TtBw')
+        self.assertEqual(key.public_key, self.keystore.public_key)
+
+    def test_unknown_multisig(self):
+        with self.assertRaises(Proposal.DoesNotExist):
+            keyring.get('34Qk88LLP4y4wRWDCCifJBujMA2CKkBUgh')
+
+
+class SignatureCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache = SignatureCache(max_entries=2)
+        self.key = SignatureCache.make_key('0100', 0, '52ae', '04ab')
+
+    def test_hit(self):
+        self.cache.set(self.key, '3045', ('aa', 0), 'v1')
+        self.assertEqual(self.cache.get(self.key, ('aa', 0), 'v1'), '3045')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get(self.key, ('aa', 0), 'v1'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_stale_preconditions(self):
+        self.cache.set(self.key, '3045', ('aa', 0), 'v1')
+        self.assertIsNone(self.cache.get(self.key, ('aa', 0), 'v2'))
+        self.assertNotIn(self.key, self.cache)
+        self.assertEqual(self.cache.stats()['stale'], 1)
+
+    def test_bounded(self):
+        for input_index in range(3):
+            key = SignatureCache.make_key('0100', input_index, '52ae', '04ab')
+            self.cache.set(key, '3045', ('aa', 0), 'v1')
+        self.assertNotIn(self.key, self.cache)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+
+class SignerTest(TestCase):
+    """
+    Every signer backend must produce these signatures byte for byte.
+    """
+    raw_tx = ('0100000002abababababababababababababababababababababababababababababababab'
+              '0000000000ffffffffcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcdcd'
+              'cdcdcdcd0100000000ffffffff0100e1f505000000001976a91411111111111111111111111111'
+              '1111111111111188ac010000000000000000000000')
+    script = ('524104466d7fcae563e5cb09a0d1870bb580344804617879a14949cf22285f1bae3f27672817'
+              '6c3c6431f8eeda4538dc37c865e2784f3a9e77d044f33e407797e1278a41043c72addb4fdf09af'
+              '94f0c94d7fe92a386a7e70cf8a1d85916386bb2535c7b1b13b306b0fe085665d8fc1b28ae1676c'
+              'd3ad6e08eaeda225fe38d0da4de55703e052ae')
+    vectors = [
+        ('2222222222222222222222222222222222222222222222222222222222222222', 0,
+         '3044022063ec3de8cc5d0f06fccd98bc1b5d971fabfddc75a44facdc4dd989c49929c7c402'
+         '20393053f74b37faabf9fb157053754cfee605fbd704211d4a58f123d976668fd701'),
+        ('2222222222222222222222222222222222222222222222222222222222222222', 1,
+         '3045022100e049f53031a1e308e20cc9a821491bb684ff58ede6d7bfe3621a621922689c25'
+         '02203b4a6b2ee59d83bb39351e2995b3fb5fbd37acdd290bc2cd83874fc2bc664ad201'),
+        ('3333333333333333333333333333333333333333333333333333333333333333', 0,
+         '3045022100bfcf94a6163ce0f43bb77165fdba31e46f702d8331451a7875246db3ff122010'
+         '022051d0edfd725e5efa23edd82a4f82444e021506b2757ce00a61a4860100cc46af01'),
+        ('e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855', 1,
+         '30450221008d7189cc674505e65c3fb320f15930129ea79aa5fb40de97932b236b05ee2949'
+         '022060e2ea37bf62ca245864716490a5c00be02e1fc550f6ad67dd3aae22a5b5a71301'),
+    ]
+
+    def assert_vectors(self, signer):
+        for private_key, input_index, signature in self.vectors:
+            key = signer.load_key(private_key)
+            self.assertEqual(signer.multisign(self.raw_tx, input_index, self.script, key), signature)
+
+    def test_gcoin_signer(self):
+        self.assert_vectors(GcoinSigner())
+
+    def test_secp256k1_signer(self):
+        # coincurve is in requirements.txt, a missing install fails here
+        self.assert_vectors(Secp256k1Signer())
+
+
+class SigningPoolTest(TestCase):
+
+    def test_sign_in_workers(self):
+        signer = GcoinSigner()
+        keys = {
+            'state1': SigningKey('pub1', signer.load_key(SignerTest.vectors[0][0])),
+            'state2': SigningKey('pub2', signer.load_key(SignerTest.vectors[2][0])),
+        }
+        jobs = [
+            ('state1', 'pub1', SignerTest.raw_tx, 0, SignerTest.script),
+            ('state1', 'pub1', SignerTest.raw_tx, 1, SignerTest.script),
+            ('state2', 'pub2', SignerTest.raw_tx, 0, SignerTest.script),
+        ]
+        # the workers inherit the patched keyring when they are forked
+        with mock.patch.object(keyring, '_keys', keys):
+            pool = SigningPool(2)
+        try:
+            signatures = pool.sign(jobs)
+        finally:
+            pool.close()
+
+        self.assertEqual(signatures, [signature for _, _, signature in SignerTest.vectors[:3]])
+        stats = pool.stats()
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_one_deadline_per_request(self):
+        class SlowSigner(object):
+            def multisign(self, tx, input_index, script, private_key):
+                time.sleep(input_index * 0.9)
+                return 'signature'
+
+        keys = {'state1': SigningKey('pub1', 1)}
+        with mock.patch.object(keyring, '_keys', keys), \
+                mock.patch('app.signing_pool.get_signer', SlowSigner):
+            pool = SigningPool(2, timeout=1.2)
+        try:
+            started = time.time()
+            # one chunk per worker, answered after 0.9s and 1.8s
+            with self.assertRaises(SigningTimeout):
+                pool.sign([('state1', 'pub1', 'tx', 1, 'script'), ('state1', 'pub1', 'tx', 2, 'script')])
+            self.assertLess(time.time() - started, 1.7)
+        finally:
+            pool.close()
+        self.assertEqual(pool.stats()['failed'], 2)
+
+
+@override_settings(RUN_BACKGROUND_TASKS_INLINE=True)
+@mock.patch('app.state_sync.state_updated')
+class StateSyncTest(TestCase):
+
+    def test_record_applied(self, state_updated):
+        self.assertEqual(record_applied('state1', 'tx1'), 1)
+        self.assertEqual(record_applied('state1', 'tx2'), 2)
+        self.assertEqual(record_applied('state1', 'tx1'), 1)
+        self.assertEqual(record_applied('state2', 'tx1'), 1)
+
+    @mock.patch('app.catchup.gcoincore.get_txs_by_address', return_value={'txs': []})
+    @mock.patch('app.state_sync.ContractStateFileUpdater')
+    def test_wait_advances_state(self, updater, get_txs_by_address, state_updated):
+        synchroniser = StateSynchroniser()
+
+        self.assertTrue(synchroniser.wait_for_tx('state1', 'tx1', 1))
+        updater.return_value.update_until_tx.assert_called_once_with('tx1')
+        self.assertTrue(StateTransaction.objects.filter(multisig_address='state1', tx_hash='tx1').exists())
+
+        # applied txs are never replayed again
+        self.assertTrue(synchroniser.wait_for_tx('state1', 'tx1', 1))
+        self.assertEqual(updater.return_value.update_until_tx.call_count, 1)
+
+    @mock.patch('app.state_sync.ContractStateFileUpdater')
+    def test_advance_records_earlier_txs(self, updater, state_updated):
+        record_applied('state1', 'tx0')
+        txs = {'txs': [{'txid': tx_hash} for tx_hash in ['tx3', 'tx2', 'tx1', 'tx0']]}
+        synchroniser = StateSynchroniser()
+
+        with mock.patch('app.catchup.gcoincore.get_txs_by_address', return_value=txs):
+            self.assertTrue(synchroniser.wait_for_tx('state1', 'tx2', 1))
+        replayed = [call[0][0] for call in updater.return_value.update_until_tx.call_args_list]
+        self.assertEqual(replayed, ['tx1', 'tx2'])
+        self.assertEqual(list(StateTransaction.objects.values_list('tx_hash', 'version')),
+                         [('tx0', 1), ('tx1', 2), ('tx2', 3)])
+
+    @mock.patch('app.catchup.gcoincore.get_txs_by_address', return_value={'txs': []})
+    @mock.patch('app.state_sync.ContractStateFileUpdater')
+    def test_wait_failed(self, updater, get_txs_by_address, state_updated):
+        updater.return_value.update_until_tx.side_effect = ValueError('tx not found')
+        synchroniser = StateSynchroniser()
+
+        with self.assertRaises(StateSyncError):
+            synchroniser.wait_for_tx('state1', 'tx1', 1)
+        self.assertEqual(synchroniser.stats()['failed'], 1)
+
+    def test_apply_skips_applied_tx(self, state_updated):
+        synchroniser = StateSynchroniser()
+        update_tx = mock.Mock(return_value=True)
+
+        self.assertTrue(synchroniser.apply_batch('state1', ['tx1'], update_tx))
+        self.assertTrue(synchroniser.apply_batch('state1', ['tx1'], update_tx))
+        self.assertEqual(update_tx.call_count, 1)
+
+    def test_apply_batch_resumes(self, state_updated):
+        synchroniser = StateSynchroniser()
+        update_tx = mock.Mock(side_effect=[True, False])
+
+        self.assertFalse(synchroniser.apply_batch('state1', ['tx1', 'tx2', 'tx3'], update_tx))
+        self.assertEqual([call[0][0] for call in update_tx.call_args_list], ['tx1', 'tx2'])
+        self.assertEqual(list(StateTransaction.objects.values_list('tx_hash', 'version')), [('tx1', 1)])
+
+        update_tx = mock.Mock(side_effect=ValueError('evm failed'))
+        with self.assertRaises(ValueError):
+            synchroniser.apply_batch('state1', ['tx1', 'tx2', 'tx3'], update_tx)
+        update_tx.assert_called_once_with('tx2')
+
+        update_tx = mock.Mock(return_value=True)
+        self.assertTrue(synchroniser.apply_batch('state1', ['tx1', 'tx2', 'tx3'], update_tx))
+        self.assertEqual(update_tx.call_count, 2)
+        self.assertEqual(list(StateTransaction.objects.values_list('tx_hash', 'version')),
+                         [('tx1', 1), ('tx2', 2), ('tx3', 3)])
+        # the cache and the index are refreshed once per batch
+        self.assertEqual(state_updated.call_count, 3)
+
+
+class DispatcherTest(TestCase):
+
+    def test_per_key_order(self):
+        dispatcher = Dispatcher(workers=4, max_queued=100)
+        done = []
+
+        def job(key, index):
+            done.append((key, index))
+
+        for index in range(20):
+            for key in ('state1', 'state2', 'state3'):
+                dispatcher.submit(key, job, key, index)
+        self.assertTrue(dispatcher.drain(timeout=10))
+
+        for key in ('state1', 'state2', 'state3'):
+            self.assertEqual([index for k, index in done if k == key], list(range(20)))
+        stats = dispatcher.stats()
+        self.assertEqual(stats['processed'], 60)
+        self.assertEqual(stats['queue_depth'], 0)
+
+    def test_queue_limit(self):
+        dispatcher = Dispatcher(workers=1, max_queued=1)
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        dispatcher.submit('state1', block)
+        started.wait()
+        dispatcher.submit('state1', block)
+        with self.assertRaises(QueueFull):
+            dispatcher.submit('state2', block)
+        # follow-up jobs of accepted work are never rejected
+        dispatcher.submit('state2', block, bounded=False)
+        release.set()
+
+        self.assertTrue(dispatcher.drain(timeout=10))
+        self.assertEqual(dispatcher.stats()['rejected'], 1)
+        with self.assertRaises(QueueFull):
+            dispatcher.submit('state1', block)
+
+    def test_failed_job(self):
+        dispatcher = Dispatcher(workers=1, max_queued=10)
+        dispatcher.submit('state1', int, 'not a number')
+        self.assertTrue(dispatcher.drain(timeout=10))
+        self.assertEqual(dispatcher.stats()['failed'], 1)
+
+
+class NotificationJobTest(TestCase):
+
+    def setUp(self):
+        for multisig_address in ('state1', 'state2'):
+            Proposal.objects.create(public_key='pub', multisig_address=multisig_address, is_state_multisig=True)
+        self.url = API_VERSION + '/addressnotify/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7'
+        self.sample_form = {
+            'tx_hash': 'e68cb204f44239ecbfd0d945760f8b377d8d943b4ceb62daa6d284617fa4386b',
+            'subscription_id': '1',
+            'notification_id': '2'
+        }
+
+    @override_settings(NOTIFICATION_QUEUE='database')
+    def test_webhook_enqueues(self):
+        response = self.client.post(self.url, self.sample_form)
+        self.assertEqual(response.status_code, httplib.OK)
+
+        job = NotificationJob.objects.get()
+        self.assertEqual(job.kind, NotificationJob.KIND_ADDRESS)
+        self.assertEqual(job.multisig_address, '3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7')
+        self.assertEqual(job.status, NotificationJob.STATUS_PENDING)
+
+    def test_claim(self):
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx1', 'state1')
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx2', 'state1')
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx3', 'state2')
+
+        claimed = jobs.claim('worker1', limit=10)
+        # one job per address at a time, the queued jobs of the address are merged into it
+        self.assertEqual([job.tx_hash for job in claimed], ['tx1', 'tx3'])
+        self.assertEqual([j.tx_hash for j in jobs.group(claimed[0])], ['tx1', 'tx2'])
+        self.assertEqual(jobs.claim('worker2', limit=10), [])
+
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx4', 'state1')
+        self.assertEqual(jobs.claim('worker2', limit=10), [])
+        jobs.complete(claimed[0])
+        self.assertEqual([job.tx_hash for job in jobs.claim('worker2', limit=10)], ['tx4'])
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BASE_DELAY=5)
+    @mock.patch('app.views.address_deploy_many', return_value=False)
+    def test_retry_with_backoff(self, address_deploy):
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx1', 'state1')
+
+        job, = jobs.claim('worker1')
+        self.assertEqual(jobs.process(job), NotificationJob.STATUS_PENDING)
+        job = NotificationJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.next_run_at, job.created)
+        # not due before the backoff delay
+        self.assertEqual(jobs.claim('worker1'), [])
+
+        NotificationJob.objects.update(next_run_at=job.created)
+        job, = jobs.claim('worker1')
+        self.assertEqual(jobs.process(job), NotificationJob.STATUS_FAILED)
+        self.assertEqual(address_deploy.call_count, 2)
+
+    def test_backoff(self):
+        self.assertEqual([jobs.backoff(attempts) for attempts in (1, 2, 3)], [5, 10, 20])
+
+    @mock.patch('smart_contract_utils.ContractTxInfo.ContractTxInfo')
+    def test_tx_jobs_serialised_with_state(self, contract_tx_info):
+        contract_tx_info.return_value.get_state_multisig_address.return_value = 'state1'
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx1', 'state1')
+        jobs.enqueue(NotificationJob.KIND_TX, 'tx2')
+
+        job, = jobs.claim('worker1', limit=10)
+        self.assertEqual(job.tx_hash, 'tx1')
+        self.assertEqual(NotificationJob.objects.get(tx_hash='tx2').state_address, 'state1')
+        # the tx job writes the same state file
+        self.assertEqual(jobs.claim('worker2', limit=10), [])
+
+        jobs.complete(job)
+        job, = jobs.claim('worker2', limit=10)
+        self.assertEqual(job.tx_hash, 'tx2')
+        with mock.patch('app.views.evm_deploy', return_value=True) as evm_deploy:
+            jobs.process(job)
+        evm_deploy.assert_called_once_with('tx2', 'state1')
+
+    def test_retry_keeps_order(self):
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx1', 'state1')
+        NotificationJob.objects.update(kind=NotificationJob.KIND_TX, state_address='state1')
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx2', 'state1')
+
+        job, = jobs.claim('worker1')
+        self.assertEqual(job.tx_hash, 'tx1')
+        self.assertEqual(jobs.fail(job, 'evm failed'), NotificationJob.STATUS_PENDING)
+        # tx2 waits for the retry of tx1
+        self.assertEqual(jobs.claim('worker1'), [])
+
+        NotificationJob.objects.filter(tx_hash='tx1').update(next_run_at=timezone.now())
+        job, = jobs.claim('worker1')
+        self.assertEqual(job.tx_hash, 'tx1')
+
+    def test_state_lock(self):
+        now = timezone.now()
+        self.assertTrue(jobs.lock_state('state1', 'worker1', now))
+        self.assertFalse(jobs.lock_state('state1', 'worker2', now))
+        jobs.unlock_state('state1', 'worker2')
+        self.assertFalse(jobs.lock_state('state1', 'worker2', now))
+
+        # the lock of a dead worker expires with its lease
+        jobs.release_expired(now + datetime.timedelta(seconds=601))
+        self.assertTrue(jobs.lock_state('state1', 'worker2', now))
+
+    def test_renew_lease(self):
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx1', 'state1')
+        job, = jobs.claim('worker1')
+        past = timezone.now() - datetime.timedelta(seconds=500)
+        NotificationJob.objects.update(claimed_at=past)
+        StateLock.objects.update(claimed_at=past)
+
+        # a running job is not reclaimed while its worker renews the lease
+        self.assertTrue(jobs.renew(job))
+        jobs.release_expired(timezone.now() + datetime.timedelta(seconds=200))
+        self.assertEqual(NotificationJob.objects.get(tx_hash='tx1').status, NotificationJob.STATUS_RUNNING)
+        self.assertFalse(jobs.lock_state('state1', 'worker2', timezone.now()))
+
+        jobs.complete(job)
+        self.assertFalse(jobs.renew(job))
+
+
+class NotificationDedupTest(TestCase):
+
+    def test_in_flight(self):
+        in_flight = jobs.InFlight()
+        self.assertTrue(in_flight.add('tx1', 'state1'))
+        self.assertFalse(in_flight.add('tx1', 'state1'))
+        # a tx notification duplicates any notification of the tx
+        self.assertFalse(in_flight.add('tx1'))
+        self.assertTrue(in_flight.add('tx1', 'state2'))
+
+        in_flight.discard('tx1', 'state1')
+        in_flight.discard('tx1', 'state2')
+        self.assertTrue(in_flight.add('tx1'))
+        self.assertFalse(in_flight.add('tx1'))
+
+    @override_settings(NOTIFICATION_QUEUE='database')
+    def test_duplicate_webhooks(self):
+        tx_hash = 'e68cb204f44239ecbfd0d945760f8b377d8d943b4ceb62daa6d284617fa4386b'
+        address_url = API_VERSION + '/addressnotify/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7'
+        form = {'tx_hash': tx_hash, 'subscription_id': '1', 'notification_id': '2'}
+
+        self.assertEqual(self.client.post(address_url, form).status_code, httplib.OK)
+        self.assertEqual(self.client.post(address_url, form).status_code, httplib.OK)
+        self.assertEqual(self.client.post(API_VERSION + '/notify/' + tx_hash).status_code, httplib.OK)
+        self.assertEqual(NotificationJob.objects.count(), 1)
+
+        # processed txs are acknowledged and skipped
+        NotificationJob.objects.all().delete()
+        record_applied('3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7', tx_hash)
+        self.assertEqual(self.client.post(API_VERSION + '/notify/' + tx_hash).status_code, httplib.OK)
+        self.assertFalse(NotificationJob.objects.exists())
+
+    def test_claim_merges_address_jobs(self):
+        Proposal.objects.create(public_key='pub', multisig_address='state1', is_state_multisig=True)
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx1', 'state1')
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx2', 'state1')
+        jobs.enqueue(NotificationJob.KIND_ADDRESS, 'tx3', 'state1')
+
+        job, = jobs.claim('worker1', limit=10)
+        self.assertEqual([j.tx_hash for j in jobs.group(job)], ['tx1', 'tx2', 'tx3'])
+
+        with mock.patch('app.views.address_deploy_many', return_value=True) as address_deploy_many:
+            self.assertEqual(jobs.process(job), NotificationJob.STATUS_DONE)
+        address_deploy_many.assert_called_once_with('state1', ['tx1', 'tx2', 'tx3'])
+        self.assertEqual(NotificationJob.objects.filter(status=NotificationJob.STATUS_DONE).count(), 3)
+
+    def test_inline_dispatch(self):
+        dispatcher = Dispatcher(workers=0, max_queued=0)
+        calls = []
+
+        def deploy(key, items):
+            calls.append((key, list(items), threading.current_thread()))
+
+        dispatcher.coalesce('state1', deploy, 'tx1')
+        dispatcher.submit('state1', calls.append, 'tx2')
+        self.assertEqual(calls, [('state1', ['tx1'], threading.current_thread()), 'tx2'])
+        self.assertEqual(dispatcher.stats()['processed'], 2)
+
+    def test_coalesced_dispatch(self):
+        dispatcher = Dispatcher(workers=1, max_queued=10)
+        release = threading.Event()
+        calls = []
+
+        def deploy(key, items):
+            calls.append((key, list(items)))
+
+        dispatcher.submit('state1', release.wait)
+        for tx_hash in ('tx1', 'tx2', 'tx3'):
+            dispatcher.coalesce('state1', deploy, tx_hash)
+        release.set()
+        self.assertTrue(dispatcher.drain(timeout=10))
+
+        self.assertEqual(calls, [('state1', ['tx1', 'tx2', 'tx3'])])
+        self.assertEqual(dispatcher.stats()['coalesced'], 2)
+
+    @mock.patch('app.views.utxo_utils.apply_tx')
+    @mock.patch('app.views.evm_deploy_many')
+    def test_address_deploy_many(self, evm_deploy_many, apply_tx):
+        Proposal.objects.create(public_key='pub', multisig_address='state1', is_state_multisig=True)
+        jobs.in_flight.add('tx1', 'state1')
+
+        views.address_deploy_many('state1', ['tx1', 'tx2', 'tx3'])
+
+        self.assertEqual(apply_tx.call_count, 3)
+        evm_deploy_many.assert_called_once_with('state1', ['tx1', 'tx2', 'tx3'])
+        self.assertTrue(jobs.in_flight.add('tx1', 'state1'))
+        jobs.in_flight.discard('tx1', 'state1')
+
+    @mock.patch('app.views.utxo_utils.apply_tx')
+    @mock.patch('app.views.evm_deploy')
+    @mock.patch('app.views.evm_deploy_many')
+    def test_address_deploy_single_tx(self, evm_deploy_many, evm_deploy, apply_tx):
+        Proposal.objects.create(public_key='pub', multisig_address='state1', is_state_multisig=True)
+
+        views.address_deploy_many('state1', ['tx1'])
+
+        # the state is known, the tx is not parsed again
+        evm_deploy_many.assert_called_once_with('state1', ['tx1'])
+        self.assertEqual(evm_deploy.call_count, 0)
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def worker_exit():
+    os._exit(1)
+
+
+def worker_raise():
+    raise ValueError('evm failed')
+
+
+class EvmPoolTest(TestCase):
+
+    def setUp(self):
+        self.pool = EvmPool(2, timeout=10)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_address_affinity(self):
+        pids = [self.pool.run('state1', worker_pid) for _ in range(3)]
+        self.assertEqual(len(set(pids)), 1)
+        self.assertNotEqual(pids[0], os.getpid())
+
+        stats = self.pool.stats()
+        self.assertEqual(stats[self.pool.worker_index('state1')]['jobs'], 3)
+
+    def test_errors(self):
+        with self.assertRaises(EvmWorkerError):
+            self.pool.run('state1', worker_raise)
+        self.assertEqual(self.pool.stats()[self.pool.worker_index('state1')]['failed'], 1)
+
+    def test_restart_crashed_worker(self):
+        pid = self.pool.run('state1', worker_pid)
+        started = time.time()
+        with self.assertRaises(EvmWorkerError):
+            self.pool.run('state1', worker_exit)
+        # noticed right away, not after the job timeout
+        self.assertLess(time.time() - started, 5)
+
+        self.assertNotEqual(self.pool.run('state1', worker_pid), pid)
+        self.assertEqual(self.pool.stats()[self.pool.worker_index('state1')]['restarts'], 1)
+
+    def test_crash_under_load(self):
+        index = self.pool.worker_index('state1')
+        other = next(key for key in ('state2', 'state3', 'state4', 'state5')
+                     if self.pool.worker_index(key) != index)
+        errors = []
+        pids = []
+
+        def run(key, fn):
+            try:
+                pids.append(self.pool.run(key, fn))
+            except EvmWorkerError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=run, args=(other, worker_pid)) for _ in range(20)]
+        threads.append(threading.Thread(target=run, args=('state1', worker_exit)))
+        started = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(errors, ['Worker {} died'.format(index)])
+        # the other worker kept answering on its own pipe
+        self.assertEqual(len(pids), 20)
+        self.assertEqual(self.pool.stats()[index]['restarts'], 1)
+        self.assertNotEqual(self.pool.run('state1', worker_pid), os.getpid())
+
+
+class CatchUpTest(TestCase):
+
+    def setUp(self):
+        # newest first, two txs per page
+        self.txs = ['tx5', 'tx4', 'tx3', 'tx2', 'tx1']
+
+    def get_txs_by_address(self, address, starting_after=None):
+        start = self.txs.index(starting_after) + 1 if starting_after else 0
+        return {'page': {}, 'txs': [{'txid': tx_hash} for tx_hash in self.txs[start:start + 2]]}
+
+    @mock.patch('app.catchup.PAGE_SIZE', 2)
+    def test_missing_txs(self):
+        with mock.patch('app.catchup.gcoincore.get_txs_by_address', self.get_txs_by_address):
+            self.assertEqual(catchup.missing_txs('state1'), ['tx1', 'tx2', 'tx3', 'tx4', 'tx5'])
+
+            record_applied('state1', 'tx2')
+            self.assertEqual(catchup.missing_txs('state1'), ['tx3', 'tx4', 'tx5'])
+
+    @mock.patch('app.catchup.PAGE_SIZE', 2)
+    @mock.patch('app.catchup.utxo_utils.reconcile')
+    @mock.patch('app.state_sync.state_updated')
+    @mock.patch('app.state_sync.ContractStateFileUpdater')
+    def test_catch_up_resumes(self, updater, state_updated, reconcile):
+        record_applied('state1', 'tx1')
+        updater.return_value.update_until_tx.side_effect = [None, ValueError('evm failed')]
+
+        with mock.patch('app.catchup.gcoincore.get_txs_by_address', self.get_txs_by_address):
+            with self.assertRaises(ValueError):
+                catchup.catch_up('state1')
+            # tx2 was checkpointed before the failure
+            updater.return_value.update_until_tx.side_effect = None
+            self.assertEqual(catchup.catch_up('state1'), 3)
+
+        replayed = [call[0][0] for call in updater.return_value.update_until_tx.call_args_list]
+        self.assertEqual(replayed, ['tx2', 'tx3', 'tx3', 'tx4', 'tx5'])
+        reconcile.assert_called_once_with('state1')
+
+
+class FakeExplorer(object):
+    """
+    Stub of the OSS explorer API over an in-memory chain.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self.txs = {}
+
+    def add_block(self, txs):
+        block_hash = 'block{}'.format(len(self.blocks))
+        block = {'hash': block_hash, 'height': len(self.blocks), 'tx': [tx['txid'] for tx in txs]}
+        if self.blocks:
+            block['previousblockhash'] = self.blocks[-1]['hash']
+            self.blocks[-1]['nextblockhash'] = block_hash
+        self.blocks.append(block)
+        for tx in txs:
+            self.txs[tx['txid']] = tx
+        return block_hash
+
+    def get_latest_blocks(self):
+        return [dict(block) for block in self.blocks[-10:]]
+
+    def get_block_by_hash(self, block_hash):
+        return dict(next(block for block in self.blocks if block['hash'] == block_hash))
+
+    def get_tx(self, tx_hash):
+        return self.txs[tx_hash]
+
+    def patch(self):
+        return mock.patch.multiple('app.chain_follower.gcoincore', get_latest_blocks=self.get_latest_blocks,
+                                   get_block_by_hash=self.get_block_by_hash,
+                                   get_block_header=self.get_block_by_hash, get_tx=self.get_tx)
+
+
+def make_tx(txid, addresses=(), spends=()):
+    return {
+        'txid': txid,
+        'vin': [{'txid': spent_txid, 'vout': vout} for spent_txid, vout in spends],
+        'vout': [{'n': n, 'scriptPubKey': {'addresses': [address]}} for n, address in enumerate(addresses)],
+    }
+
+
+@override_settings(NOTIFICATION_QUEUE='database')
+class ChainFollowerTest(TestCase):
+
+    def setUp(self):
+        Proposal.objects.create(public_key='pub1', multisig_address='state1', is_state_multisig=True)
+        Proposal.objects.create(public_key='pub2', multisig_address='state2', is_state_multisig=True)
+        StateUtxo.objects.create(multisig_address='state2', txid='tx0', vout=0, block_time=1)
+        self.explorer = FakeExplorer()
+        self.explorer.add_block([make_tx('coinbase0')])
+
+    def queued(self):
+        return list(NotificationJob.objects.order_by('id').values_list('multisig_address', 'tx_hash'))
+
+    def test_follow(self):
+        follower = ChainFollower()
+        with self.explorer.patch():
+            # a new follower starts at the tip
+            self.assertEqual(follower.follow(), 0)
+            self.assertEqual(ChainCursor.objects.get().block_hash, 'block0')
+
+            self.explorer.add_block([make_tx('tx1', addresses=['state1', 'other']), make_tx('tx2', ['other'])])
+            self.explorer.add_block([make_tx('tx3', addresses=['other'], spends=[('tx0', 0)])])
+            self.assertEqual(follower.follow(), 2)
+            self.assertEqual(self.queued(), [('state1', 'tx1'), ('state2', 'tx3')])
+
+            # nothing new at the tip
+            self.assertEqual(follower.follow(), 0)
+            self.explorer.add_block([make_tx('tx4', addresses=['state1', 'state2'])])
+            self.assertEqual(follower.follow(), 1)
+
+        self.assertEqual(self.queued()[2:], [('state1', 'tx4'), ('state2', 'tx4')])
+        cursor = ChainCursor.objects.get()
+        self.assertEqual((cursor.block_hash, cursor.height), ('block3', 3))
+        self.assertEqual(follower.txs, 4)
+
+    def test_resume(self):
+        with self.explorer.patch():
+            for index in range(5):
+                self.explorer.add_block([make_tx('tx{}'.format(index), addresses=['state1'])])
+            start_at('default', 'block0')
+
+            self.assertEqual(ChainFollower().follow(max_blocks=2), 2)
+            # a new follower continues after the persisted cursor
+            self.assertEqual(ChainFollower().follow(), 3)
+
+        self.assertEqual([tx_hash for _, tx_hash in self.queued()], ['tx0', 'tx1', 'tx2', 'tx3', 'tx4'])
+
+
+@override_settings(RUN_BACKGROUND_TASKS_INLINE=True)
+@mock.patch('app.views.wallet_address_to_evm', lambda address: 'e8a4373d99ed09f9e44454f016ca30a1d2184dd1')
+class AsgiTest(StateFileTestCase):
+
+    def setUp(self):
+        super(AsgiTest, self).setUp()
+        from oracle import asgi
+        self.asgi = asgi
+
+    def request(self, method, path, query_string=b'', body=b''):
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+                 'headers': [(b'content-type', b'application/x-www-form-urlencoded')]}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.get_event_loop().run_until_complete(self.asgi.application(scope, receive, send))
+        self.assertEqual([message['type'] for message in sent], ['http.response.start', 'http.response.body'])
+        return sent[0]['status'], sent[1]['body']
+
+    def test_storage(self):
+        status, body = self.request('GET', API_VERSION + '/storage/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7/',
+                                    b'limit=5')
+        data = json.loads(body.decode('utf-8'))
+        self.assertEqual(status, httplib.OK)
+        self.assertEqual(len(data['storage']), 5)
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_invalid_query(self):
+        status, _ = self.request('GET', API_VERSION + '/storage/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7/', b'limit=0')
+        self.assertEqual(status, httplib.BAD_REQUEST)
+
+    def test_address_notified_bad_request(self):
+        status, _ = self.request('POST', API_VERSION + '/addressnotify/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7',
+                                 body=b'subscription_id=1')
+        self.assertEqual(status, httplib.NOT_ACCEPTABLE)
+
+    def test_not_found(self):
+        status, _ = self.request('GET', API_VERSION + '/no-such-endpoint/')
+        self.assertEqual(status, httplib.NOT_FOUND)
+
+    @override_settings(ASGI_MAX_BODY_SIZE=10)
+    def test_body_too_large(self):
+        status, body = self.request('POST', API_VERSION + '/addressnotify/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7',
+                                    body=b'subscription_id=1')
+        self.assertEqual(status, httplib.REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(json.loads(body.decode('utf-8'))['errors'][0]['code'], httplib.REQUEST_ENTITY_TOO_LARGE)
+
+    def test_error_is_json(self):
+        with mock.patch.object(self.asgi, 'wsgi_application', side_effect=ValueError('broken')):
+            status, body = self.request('GET', API_VERSION + '/storage/3NfaDCrVHqQyLWHkvJqyTeVyLoLCgmdLt7/')
+        self.assertEqual(status, httplib.INTERNAL_SERVER_ERROR)
+        self.assertEqual(json.loads(body.decode('utf-8'))['errors'][0]['message'], 'broken')
+
+
+EVM_SERVER = '''
+import json, os, sys, time
+for line in sys.stdin:
+    request = json.loads(line)
+    calls = request.get('calls', [request])
+    if calls[0]['receiver'] == 'exit':
+        sys.exit(1)
+    if calls[0]['receiver'] == 'hang':
+        time.sleep(60)
+    results = []
+    with open(request['read']) as f:
+        state = f.read()
+    for call in calls:
+        if call['receiver'] == 'bad':
+            results.append({'ok': False, 'error': 'bad receiver'})
+            continue
+        state += '{} {}\\n'.format(os.getpid(), call.get('input', call.get('code')))
+        results.append({'ok': True})
+    with open(request['write'], 'w') as f:
+        f.write(state)
+    if 'calls' in request:
+        print(json.dumps({'ok': True, 'results': results}), flush=True)
+    else:
+        print(json.dumps(results[0]), flush=True)
+'''
+
+
+class OraclizeTest(TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.patchers = [
+            mock.patch('app.oraclize.STATES_PATH', self.state_dir + '/'),
+            mock.patch('app.state_cache.EVM_PATH', os.path.join(self.state_dir, '{multisig_address}')),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        open(os.path.join(self.state_dir, 'state1'), 'w').close()
+        self.executor = oraclize.PersistentExecutor(command='"{}" -c "{}"'.format(sys.executable, EVM_SERVER),
+                                                    retry_delay=0)
+
+    def tearDown(self):
+        self.executor.close()
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.state_dir)
+
+    def state_files(self):
+        return [name for name in os.listdir(self.state_dir) if not name.startswith('.')]
+
+    def state_lines(self):
+        with open(os.path.join(self.state_dir, 'state1')) as f:
+            return [line.split() for line in f]
+
+    @mock.patch('subprocess.check_call')
+    def test_subprocess(self, check_call):
+        with mock.patch('app.oraclize._executor', oraclize.SubprocessExecutor()):
+            oraclize.set_var_oraclize_contract('state1', 'oraclize1', '5')
+        command = check_call.call_args[0][0]
+        self.assertEqual(command[1:], ['--read', self.state_dir + '/state1', '--input', '76cafced' + '0' * 63 + '5',
+                                       '--receiver', 'oraclize1', '--write', self.state_dir + '/state1'])
+
+    def test_persistent(self):
+        with mock.patch('app.oraclize._executor', self.executor):
+            oraclize.deployOraclizeContract('state1', 'oraclize1', '6060')
+            oraclize.set_var_oraclize_contract('state1', 'oraclize1', '255')
+        lines = self.state_lines()
+        self.assertEqual([line[1] for line in lines], ['6060', '76cafced' + '0' * 62 + 'ff'])
+        # both calls were served by the same process
+        self.assertEqual(lines[0][0], lines[1][0])
+        self.assertEqual(self.executor.stats()['fallbacks'], 0)
+
+    def test_error(self):
+        path = os.path.join(self.state_dir, 'state1')
+        with self.assertRaises(oraclize.EvmError):
+            self.executor.run({'read': path, 'write': path, 'receiver': 'bad', 'input': ''})
+        self.assertEqual(self.executor.stats()['fallbacks'], 0)
+
+    def test_fallback(self):
+        path = os.path.join(self.state_dir, 'state1')
+        executor = oraclize.PersistentExecutor(command=os.path.join(self.state_dir, 'no-such-server'))
+        with mock.patch.object(executor.fallback, 'run') as fallback:
+            executor.run({'read': path, 'write': path, 'receiver': 'oraclize1', 'input': '01'})
+            self.assertEqual(fallback.call_count, 1)
+        self.assertEqual(executor.stats()['fallbacks'], 1)
+
+    def test_server_exit(self):
+        path = os.path.join(self.state_dir, 'state1')
+        with mock.patch.object(self.executor.fallback, 'run') as fallback:
+            # the server read the request, running it again could apply it twice
+            with self.assertRaises(oraclize.EvmError):
+                self.executor.run({'read': path, 'write': path, 'receiver': 'exit', 'input': '00'})
+            # the server is started again on the next call
+            self.executor.run({'read': path, 'write': path, 'receiver': 'oraclize1', 'input': '01'})
+            self.assertEqual(fallback.call_count, 0)
+        self.assertEqual(self.executor.stats()['restarts'], 2)
+
+    def test_server_timeout(self):
+        path = os.path.join(self.state_dir, 'state1')
+        self.executor.timeout = 0.5
+        started = time.time()
+        with self.assertRaises(oraclize.EvmError):
+            self.executor.run({'read': path, 'write': path, 'receiver': 'hang', 'input': '00'})
+        self.assertLess(time.time() - started, 5)
+        self.executor.run({'read': path, 'write': path, 'receiver': 'oraclize1', 'input': '01'})
+        stats = self.executor.stats()
+        self.assertEqual((stats['timeouts'], stats['restarts'], stats['fallbacks']), (1, 2, 0))
+        self.assertEqual(len(self.state_lines()), 1)
+
+    def test_batch(self):
+        updates = [('oraclize1', '1'), ('bad', '2'), ('oraclize2', 'x'), ('oraclize2', '3')]
+        with mock.patch('app.oraclize._executor', self.executor):
+            results = oraclize.set_vars_oraclize_contract('state1', updates)
+        self.assertEqual([result['succeeded'] for result in results], [True, False, False, True])
+        self.assertEqual(results[1]['error'], 'bad receiver')
+        self.assertTrue(results[2]['error'].startswith('Invalid value'))
+        self.assertEqual([line[1][-1] for line in self.state_lines()], ['1', '3'])
+        # one request for the whole batch
+        self.assertEqual(self.executor.stats()['calls'], 1)
+        self.assertEqual(self.state_files(), ['state1'])
+
+    @mock.patch('subprocess.check_call')
+    def test_batch_subprocess(self, check_call):
+        check_call.side_effect = [None, subprocess.CalledProcessError(1, 'evm')]
+        with mock.patch('app.oraclize._executor', oraclize.SubprocessExecutor()):
+            results = oraclize.set_vars_oraclize_contract('state1', [('oraclize1', '1'), ('oraclize1', '2')])
+        self.assertEqual([result['succeeded'] for result in results], [True, False])
+        # every run works on the copy of the state file
+        working_path = os.path.join(self.state_dir, 'state1.batch')
+        self.assertEqual([call[0][0][2] for call in check_call.call_args_list], [working_path, working_path])
+        self.assertEqual(self.state_files(), ['state1'])
+
+    def test_batch_state_changed(self):
+        path = os.path.join(self.state_dir, 'state1')
+
+        def run_batch(working_path, calls):
+            # a writer which does not take the state file lock
+            with open(path, 'w') as f:
+                f.write('tx\n')
+            return [(True, None) for _ in calls]
+
+        with mock.patch('app.oraclize._executor', self.executor), \
+                mock.patch.object(self.executor, 'run_batch', run_batch):
+            with self.assertRaises(oraclize.EvmError):
+                oraclize.set_vars_oraclize_contract('state1', [('oraclize1', '1')])
+        self.assertEqual(self.state_lines(), [['tx']])
+        self.assertEqual(self.state_files(), ['state1'])
+
+
+FEED_VALUES = {}
+
+
+def feed_value():
+    return FEED_VALUES
+
+
+class OraclizeFeedTest(TestCase):
+
+    def setUp(self):
+        FEED_VALUES.update({'a': '1', 'b': '2', 'c': '3'})
+        self.contracts = [OraclizeContract.objects.create(name=name, address='oraclize_' + name, interface='',
+                                                          byte_code='') for name in 'abc']
+        for contract, multisig_address in zip(self.contracts, ['state1', 'state1', 'state2']):
+            OraclizeFeed.objects.create(oraclize_contract=contract, multisig_address=multisig_address,
+                                        source='app.tests.feed_value', source_key=contract.name,
+                                        interval=10, threshold=1)
+        self.batches = []
+        self.patcher = mock.patch('app.oraclize_feeds.set_vars_oraclize_contract', self.fake_set_vars)
+        self.patcher.start()
+        self.scheduler = FeedScheduler()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def fake_set_vars(self, multisig_address, updates):
+        self.batches.append((multisig_address, updates))
+        return [{'oraclize_address': address, 'value': value, 'succeeded': address != 'oraclize_broken',
+                 'error': None if address != 'oraclize_broken' else 'failed'} for address, value in updates]
+
+    def later(self, seconds):
+        return timezone.now() + datetime.timedelta(seconds=seconds)
+
+    def test_batches_per_state(self):
+        self.assertEqual(self.scheduler.run_due(), 3)
+        self.assertEqual(sorted(self.batches), [
+            ('state1', [('oraclize_a', '1'), ('oraclize_b', '2')]),
+            ('state2', [('oraclize_c', '3')]),
+        ])
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['applied'], stats['state_writes']), (3, 2))
+        # not due before the interval elapsed
+        self.assertEqual(self.scheduler.run_due(self.later(5)), 0)
+        self.assertEqual(self.scheduler.stats()['polls'], 3)
+
+    def test_threshold(self):
+        self.scheduler.run_due()
+        FEED_VALUES.update({'a': '1.5', 'b': '4'})
+        self.assertEqual(self.scheduler.run_due(self.later(11)), 1)
+        self.assertEqual(self.batches[-1], ('state1', [('oraclize_b', '4')]))
+        self.assertEqual(self.scheduler.stats()['skipped_threshold'], 2)
+        self.assertEqual(OraclizeFeed.objects.get(oraclize_contract__name='a').last_value, '1')
+
+    def test_debounce(self):
+        OraclizeFeed.objects.update(debounce=60)
+        self.scheduler.run_due()
+        FEED_VALUES['c'] = '10'
+        self.assertEqual(self.scheduler.run_due(self.later(11)), 0)
+        self.assertEqual(self.scheduler.stats()['skipped_debounce'], 1)
+        self.assertEqual(self.scheduler.run_due(self.later(61)), 1)
+        self.assertEqual(self.batches[-1], ('state2', [('oraclize_c', '10')]))
+
+    def test_keeps_admin_edits(self):
+        def disable_feeds(multisig_address, updates):
+            # edited while the batch runs
+            OraclizeFeed.objects.update(enabled=False, threshold=5)
+            return self.fake_set_vars(multisig_address, updates)
+
+        with mock.patch('app.oraclize_feeds.set_vars_oraclize_contract', disable_feeds):
+            self.assertEqual(self.scheduler.run_due(), 3)
+        feeds = OraclizeFeed.objects.all()
+        self.assertEqual([(feed.enabled, feed.threshold) for feed in feeds], [(False, 5)] * 3)
+        self.assertEqual([feed.last_value for feed in feeds], ['1', '2', '3'])
+
+    def test_failures(self):
+        OraclizeContract.objects.filter(name='b').update(address='oraclize_broken')
+        FEED_VALUES['a'] = 'not a number'
+        self.assertEqual(self.scheduler.run_due(), 1)
+        feeds = {feed.oraclize_contract.name: feed for feed in OraclizeFeed.objects.all()}
+        self.assertTrue(feeds['a'].last_error.startswith('ValueError'))
+        self.assertEqual((feeds['b'].last_value, feeds['b'].last_error), ('', 'failed'))
+        self.assertEqual(feeds['c'].last_value, '3')
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['poll_failures'], stats['failed'], stats['applied']), (1, 1, 1))
@@ -0,0 +1,200 @@
+"""
+UTXO sets of the state multisig addresses.
+
+The set of every state multisig is kept in the StateUtxo table: address
+notifications add the outputs of new txs and remove the outputs they spend,
+and `reconcile` replaces it with the set known by OSS.
+
+Resolving the confirmation time of a UTXO needs two OSS round trips (the tx
+for its block hash, then the block for its time). When many UTXOs are
+resolved at once the lookups run on a bounded thread pool under one overall
+deadline, so it takes about as long as the slowest lookup instead of the sum
+of all of them. A lookup still running at the deadline cannot be cancelled
+and keeps its thread until its OSS calls time out, so the lookups have a
+pool of their own instead of the shared `get_executor` of the chain follower
+and the feeds.
+"""
+import concurrent.futures
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from app.models import StateUtxo
+from gcoinbackend import core as gcoincore
+
+UNCONFIRMED = 'unconfirmed'
+TIMEOUT = 'timeout'
+
+_executor = None
+_lookup_executor = None
+_executor_lock = threading.Lock()
+
+
+class UtxoLookupError(Exception):
+    """
+    Raised when the oldest UTXO cannot be determined because some lookups
+    failed. `failures` maps (txid, vout) to the reason of the failure.
+    """
+
+    def __init__(self, failures):
+        super(UtxoLookupError, self).__init__('Cannot resolve {} utxos'.format(len(failures)))
+        self.failures = failures
+
+
+class UnconfirmedTx(Exception):
+    pass
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = getattr(settings, 'UTXO_LOOKUP_CONCURRENCY', 16)
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    return _executor
+
+
+def get_lookup_executor():
+    global _lookup_executor
+    with _executor_lock:
+        if _lookup_executor is None:
+            max_workers = getattr(settings, 'UTXO_LOOKUP_CONCURRENCY', 16)
+            _lookup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    return _lookup_executor
+
+
+def get_block_time(txid):
+    raw_tx = gcoincore.get_tx(txid)
+    if not raw_tx.get('blockhash'):
+        raise UnconfirmedTx(txid)
+    block = gcoincore.get_block_header(raw_tx['blockhash'])
+    return int(block['time'])
+
+
+def resolve_block_times(utxos, timeout=None):
+    """
+    Look up the block time of every utxo concurrently.
+
+    Returns `(block_times, failures)`, both keyed by (txid, vout). A failure
+    is UNCONFIRMED, TIMEOUT when the overall deadline passed first, or the
+    error message of the failed OSS call.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'UTXO_LOOKUP_TIMEOUT', 15)
+    executor = get_lookup_executor()
+    # outputs of the same tx share one lookup
+    futures = {}
+    for txid in set(utxo['txid'] for utxo in utxos):
+        futures[executor.submit(get_block_time, txid)] = txid
+
+    tx_times = {}
+    tx_failures = {}
+    done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+    for future in done:
+        txid = futures[future]
+        try:
+            tx_times[txid] = future.result()
+        except UnconfirmedTx:
+            tx_failures[txid] = UNCONFIRMED
+        except Exception as e:
+            tx_failures[txid] = str(e) or e.__class__.__name__
+    for future in not_done:
+        future.cancel()
+        tx_failures[futures[future]] = TIMEOUT
+
+    block_times = {}
+    failures = {}
+    for utxo in utxos:
+        outpoint = (utxo['txid'], utxo['vout'])
+        if utxo['txid'] in tx_times:
+            block_times[outpoint] = tx_times[utxo['txid']]
+        else:
+            failures[outpoint] = tx_failures[utxo['txid']]
+    return block_times, failures
+
+
+def find_oldest_utxo(outpoints, block_times):
+    """
+    Return the outpoint with the earliest block time, the first one in
+    `outpoints` order on ties, or None when no outpoint is confirmed.
+    """
+    old_utxo = None
+    for outpoint in outpoints:
+        if outpoint not in block_times:
+            continue
+        if old_utxo is None or block_times[outpoint] < block_times[old_utxo]:
+            old_utxo = outpoint
+    return old_utxo
+
+
+def get_state_utxos(multisig_address, refresh=False):
+    """
+    Return `(old_utxo, all_utxos)` of a state multisig from the local set.
+
+    The set is reconciled against OSS first when `refresh` is set or when
+    nothing is known about the address yet.
+    """
+    utxos = list(StateUtxo.objects.filter(multisig_address=multisig_address))
+    if refresh or not utxos:
+        reconcile(multisig_address)
+        utxos = list(StateUtxo.objects.filter(multisig_address=multisig_address))
+
+    all_utxos = [utxo.as_outpoint() for utxo in utxos]
+    block_times = {utxo.as_outpoint(): utxo.block_time for utxo in utxos if utxo.block_time is not None}
+    return find_oldest_utxo(all_utxos, block_times), all_utxos
+
+
+def reconcile(multisig_address):
+    """
+    Replace the local utxo set of `multisig_address` with the one of OSS.
+    """
+    utxos = gcoincore.get_address_utxos(multisig_address)
+    block_times, failures = resolve_block_times(utxos)
+    errors = {outpoint: reason for outpoint, reason in failures.items() if reason != UNCONFIRMED}
+    if errors:
+        raise UtxoLookupError(errors)
+
+    outpoints = set((utxo['txid'], utxo['vout']) for utxo in utxos)
+    with transaction.atomic():
+        for utxo in StateUtxo.objects.filter(multisig_address=multisig_address):
+            outpoint = utxo.as_outpoint()
+            if outpoint not in outpoints:
+                utxo.delete()
+            elif utxo.block_time != block_times.get(outpoint):
+                utxo.block_time = block_times.get(outpoint)
+                utxo.save(update_fields=['block_time'])
+            outpoints.discard(outpoint)
+
+        StateUtxo.objects.bulk_create([
+            StateUtxo(multisig_address=multisig_address, txid=txid, vout=vout,
+                      block_time=block_times.get((txid, vout)))
+            for txid, vout in outpoints
+        ])
+
+
+def apply_tx(multisig_address, tx_hash):
+    """
+    Update the local utxo set of `multisig_address` with a confirmed tx.
+
+    Unconfirmed txs are ignored; they are picked up by the next reconcile.
+    """
+    tx = gcoincore.get_tx(tx_hash)
+    if not tx.get('blockhash'):
+        return False
+    block_time = tx.get('blocktime')
+    if block_time is None:
+        block_time = gcoincore.get_block_header(tx['blockhash'])['time']
+
+    with transaction.atomic():
+        for vin in tx.get('vin', []):
+            # coinbase inputs do not spend anything
+            if 'txid' in vin:
+                StateUtxo.objects.filter(multisig_address=multisig_address,
+                                         txid=vin['txid'], vout=vin['vout']).delete()
+        for vout in tx.get('vout', []):
+            if multisig_address in vout.get('scriptPubKey', {}).get('addresses', []):
+                StateUtxo.objects.update_or_create(
+                    multisig_address=multisig_address, txid=tx_hash, vout=vout['n'],
+                    defaults={'block_time': int(block_time)})
+    return True
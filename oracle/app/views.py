@@ -1,28 +1,38 @@
 import base58
 import binascii
+import bisect
 import hashlib
-import json
 import re
-import threading
 
-from gcoin import multisign, deserialize, ripemd
+from gcoin import deserialize, ripemd
 
 from django.http import JsonResponse
 from django.views.generic import View
 from django.views.generic.edit import BaseFormView, ProcessFormView
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 
 from rest_framework import status
-from app import response_utils
-from app.models import Keystore, OraclizeContract, Proposal
-from smart_contract_utils.ContractStateFileUpdater import ContractStateFileUpdater
+from app import holdings, jobs, response_utils
+from app.dispatcher import QueueFull, get_dispatcher
+from app.evm_pool import get_evm_pool, run_for_state
+from app import utxos as utxo_utils
+from app.keyring import keyring
+from app.models import Keystore, NotificationJob, OraclizeContract, Proposal
+from app.oraclize import get_evm_executor
+from app.signature_cache import signature_cache
+from app.signing_pool import SigningTimeout, get_signing_pool
+from app.state_cache import state_cache, state_path, state_version
+from app.state_sync import is_processed, state_sync
 from smart_contract_utils.ContractTxInfo import ContractTxInfo
 from smart_contract_utils.models import StateInfo
 from smart_contract_utils.utils import wallet_address_to_evm
 from oracle.mixins import CsrfExemptMixin
 from gcoinbackend import core as gcoincore
+from gcoinbackend.signers import get_signer
 
-from .forms import MultisigAddrFrom, SignForm, NotifyForm
+from .forms import (BatchBalanceForm, BatchSignForm, MultisigAddrFrom, SignForm,
+                    NotifyForm, StorageQueryForm)
 
 pubkey_hash_re = re.compile(r'^76a914[a-f0-9]{40}88ac$')
 pubkey_re = re.compile(r'^21[a-f0-9]{66}ac$')
@@ -33,8 +43,6 @@ try:
 except ImportError:
     import httplib
 
-EVM_PATH = '../oracle/states/{multisig_address}'
-
 
 def addressFromScriptPubKey(script_pub_key):
     script_pub_key = script_pub_key.lower()
@@ -67,19 +75,128 @@ def get_callback_url(request, multisig_address):
     return callback_url
 
 
-def evm_deploy(tx_hash):
+def address_deploy(multisig_address, tx_hash):
+    return address_deploy_many(multisig_address, [tx_hash])
+
+
+def address_deploy_many(multisig_address, tx_hashes):
+    """
+    Process the notifications of `tx_hashes`, in arrival order, for one
+    address. A state multisig is advanced to the last tx with one replay.
+    """
+    try:
+        is_state_multisig = Proposal.objects.filter(
+            multisig_address=multisig_address, is_state_multisig=True).exists()
+        if is_state_multisig:
+            for tx_hash in tx_hashes:
+                try:
+                    utxo_utils.apply_tx(multisig_address, tx_hash)
+                except Exception as e:
+                    print('Update utxos failed: ' + str(e))
+            return evm_deploy_many(multisig_address, tx_hashes)
+        return all([evm_deploy(tx_hash) for tx_hash in tx_hashes])
+    finally:
+        for tx_hash in tx_hashes:
+            jobs.in_flight.discard(tx_hash, multisig_address)
+
+
+def dispatch_evm_deploy(tx_hash):
+    # the state of a tx is only known once the tx is parsed, queue it behind
+    # the other txs of that state
+    try:
+        state_multisig_address = ContractTxInfo(tx_hash).get_state_multisig_address()
+        get_dispatcher().coalesce(state_multisig_address, deploy_notified_txs, tx_hash, bounded=False)
+    except Exception:
+        jobs.in_flight.discard(tx_hash)
+        raise
+
+
+def deploy_notified_txs(state_multisig_address, tx_hashes):
+    try:
+        return evm_deploy_many(state_multisig_address, tx_hashes)
+    finally:
+        for tx_hash in tx_hashes:
+            jobs.in_flight.discard(tx_hash)
+
+
+def evm_deploy(tx_hash, state_multisig_address=None):
+    if is_processed(tx_hash):
+        print('Skip processed tx_hash ' + tx_hash)
+        return True
     print('Deploy tx_hash ' + tx_hash)
-    # parse tx
-    contract_tx_info = ContractTxInfo(tx_hash)
-    state_multisig_address = contract_tx_info.get_state_multisig_address()
-    # update tx into corresponding state file
-    state_info, _ = StateInfo.objects.get_or_create(multisig_address=state_multisig_address)
-    completed = state_info.update_with_tx_hash(tx_hash)
+    if state_multisig_address is None:
+        # parse tx
+        contract_tx_info = ContractTxInfo(tx_hash)
+        state_multisig_address = contract_tx_info.get_state_multisig_address()
+    return evm_deploy_many(state_multisig_address, [tx_hash])
+
+
+def evm_deploy_many(state_multisig_address, tx_hashes):
+    """
+    Apply `tx_hashes`, in order, to the state file of `state_multisig_address`
+    as one checkpointed batch.
+    """
+    if len(tx_hashes) > 1:
+        print('Deploy {} txs to {}'.format(len(tx_hashes), state_multisig_address))
+    completed = run_for_state(state_multisig_address, apply_state_txs, state_multisig_address, tx_hashes)
+    # the file may have been rewritten by an EVM worker
+    state_cache.invalidate(state_multisig_address)
 
     if completed:
         print('Deployed Success')
     else:
         print('Deployed Failed')
+    return completed
+
+
+def apply_state_txs(state_multisig_address, tx_hashes):
+    # update tx into corresponding state file
+    state_info, _ = StateInfo.objects.get_or_create(multisig_address=state_multisig_address)
+    return state_sync.apply_batch(state_multisig_address, tx_hashes, state_info.update_with_tx_hash)
+
+
+def queue_notification(kind, tx_hash, multisig_address=''):
+    """
+    Hand a notification to the configured queue. Returns the
+    (response, status) of the error when it cannot be accepted.
+    """
+    if kind == NotificationJob.KIND_TX and is_processed(tx_hash):
+        # retried by OSS or already processed through an address notification
+        return None
+
+    if getattr(settings, 'NOTIFICATION_QUEUE', 'memory') == 'database':
+        if not jobs.is_queued(tx_hash, multisig_address):
+            jobs.enqueue(kind, tx_hash, multisig_address)
+        return None
+
+    if not jobs.in_flight.add(tx_hash, multisig_address):
+        return None
+    try:
+        if kind == NotificationJob.KIND_ADDRESS:
+            get_dispatcher().coalesce(multisig_address, address_deploy_many, tx_hash)
+        else:
+            get_dispatcher().submit(tx_hash, dispatch_evm_deploy, tx_hash)
+    except QueueFull as e:
+        jobs.in_flight.discard(tx_hash, multisig_address)
+        return response_utils.error_data(httplib.SERVICE_UNAVAILABLE, str(e))
+    return None
+
+
+def public_key_data(multisig_address=None):
+    if multisig_address:
+        try:
+            proposal = Proposal.objects.get(multisig_address=multisig_address)
+            public_key = proposal.public_key
+        except Proposal.DoesNotExist:
+            response = {
+                'error': 'no matching multisig address.'
+            }
+            return response, httplib.NOT_FOUND
+    else:
+        keystore = Keystore.objects.get_default_keypair()
+        public_key = keystore.public_key
+    response = {'public_key': public_key}
+    return response, httplib.OK
 
 
 class Proposes(CsrfExemptMixin, BaseFormView):
@@ -89,23 +206,8 @@ class Proposes(CsrfExemptMixin, BaseFormView):
     http_method_name = ['get']
 
     def get(self, request, *args, **kwargs):
-        multisig_address = None
-        if 'multisig_address' in kwargs:
-            multisig_address = kwargs['multisig_address']
-        if multisig_address:
-            try:
-                proposal = Proposal.objects.get(multisig_address=multisig_address)
-                public_key = proposal.public_key
-            except Proposal.DoesNotExist:
-                response = {
-                    'error': 'no matching multisig address.'
-                }
-                return JsonResponse(response, status=httplib.NOT_FOUND)
-        else:
-            keystore = Keystore.objects.get_default_keypair()
-            public_key = keystore.public_key
-        response = {'public_key': public_key}
-        return JsonResponse(response, status=httplib.OK)
+        response, status = public_key_data(kwargs.get('multisig_address'))
+        return JsonResponse(response, status=status)
 
 
 class Multisig_addr(CsrfExemptMixin, BaseFormView):
@@ -162,14 +264,104 @@ class Sign(CsrfExemptMixin, BaseFormView):
         if 'contract_address' in form.data:
             contract_address = form.cleaned_data['contract_address']
 
+        cache_key = None
+        try:
+            public_key = keyring.get(state_multisig_address).public_key
+            cache_key = signature_cache.make_key(tx, input_index, script, public_key, contract_address)
+        except ObjectDoesNotExist:
+            pass
+        signature = self.get_cached_signature(cache_key, state_multisig_address) if cache_key else None
+        if signature:
+            response = {'signature': signature}
+            return JsonResponse(response, status=httplib.OK)
+
         decoded_tx = deserialize(tx)
+        error_response = self.validate_tx(decoded_tx, state_multisig_address, contract_address)
+        if error_response:
+            return error_response
+
+        # signature = connection.signrawtransaction(tx)
+        try:
+            signature, = self.sign_inputs(tx, [(input_index, script)], state_multisig_address)
+        except SigningTimeout:
+            response = {'error': 'Signing timed out'}
+            return JsonResponse(response, status=httplib.SERVICE_UNAVAILABLE)
+        if cache_key:
+            self.cache_signature(cache_key, state_multisig_address, signature)
+        # return only signature hex
+        response = {'signature': signature}
+
+        return JsonResponse(response, status=httplib.OK)
+
+    def get_cached_signature(self, cache_key, state_multisig_address):
+        try:
+            old_utxo, _ = self.get_oldest_utxo(state_multisig_address)
+            version = state_version(state_multisig_address)
+        except Exception:
+            return None
+        return signature_cache.get(cache_key, old_utxo, version)
+
+    def cache_signature(self, cache_key, state_multisig_address, signature):
+        try:
+            old_utxo, _ = self.get_oldest_utxo(state_multisig_address)
+            version = state_version(state_multisig_address)
+        except Exception:
+            return
+        signature_cache.set(cache_key, signature, old_utxo, version)
+
+    def form_invalid(self, form):
+        response = {'error': form.errors}
+
+        return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+    def get_private_key(self, state_multisig_address):
+        return keyring.get(state_multisig_address).private_key
+
+    def sign_inputs(self, tx, inputs, state_multisig_address):
+        """
+        Sign the (input_index, script) `inputs` of `tx`, in the signing pool
+        when one is configured.
+        """
+        signing_pool = get_signing_pool()
+        if signing_pool is None:
+            private_key = self.get_private_key(state_multisig_address)
+            signer = get_signer()
+            return [signer.multisign(tx, input_index, script, private_key) for input_index, script in inputs]
+
+        public_key = keyring.get(state_multisig_address).public_key
+        signing_jobs = [(state_multisig_address, public_key, tx, input_index, script) for input_index, script in inputs]
+        return signing_pool.sign(signing_jobs)
+
+    def validate_tx(self, decoded_tx, state_multisig_address, contract_address):
+        """
+        Check that the tx spends the oldest utxo of the state multisig and
+        that the state allows its outputs.
+
+        Returns an error response, or None when the tx can be signed.
+        """
         try:
             old_utxo, all_utxos = self.get_oldest_utxo(state_multisig_address)
-            updater = ContractStateFileUpdater(state_multisig_address)
-            updater.update_until_tx(old_utxo[0])
+            if not self.spends_oldest_utxo(decoded_tx, old_utxo, all_utxos):
+                # the local utxo set may have missed a notification
+                old_utxo, all_utxos = self.get_oldest_utxo(state_multisig_address, refresh=True)
+            timeout = getattr(settings, 'STATE_SYNC_WAIT_TIMEOUT', 5)
+            synchronised = state_sync.wait_for_tx(state_multisig_address, old_utxo[0], timeout)
+        except utxo_utils.UtxoLookupError as e:
+            response = {
+                'error': 'Cannot resolve utxos',
+                'utxos': [{'txid': txid, 'vout': vout, 'reason': reason}
+                          for (txid, vout), reason in e.failures.items()],
+            }
+            return JsonResponse(response, status=httplib.SERVICE_UNAVAILABLE)
         except Exception:
             response = {'error': 'Do not contain oldest tx'}
             return JsonResponse(response, status=httplib.NOT_FOUND)
+        if not synchronised:
+            # the synchroniser keeps advancing the state, the client retries
+            response = JsonResponse({'error': 'State is not synchronised yet'},
+                                    status=httplib.SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
         contained_old = False
 
         for vin in decoded_tx['ins']:
@@ -186,119 +378,252 @@ class Sign(CsrfExemptMixin, BaseFormView):
 
         # need to check contract result before sign Tx
         try:
-            with open(EVM_PATH.format(multisig_address=state_multisig_address), 'r') as f:
-                content = json.load(f)
-                for vout in decoded_tx['outs']:
-                    output_address = addressFromScriptPubKey(vout['script'])
-                    output_color = vout['color']
-                    # convert to diqi
-                    output_value = vout['value'] / 100000000
-                    if output_address == state_multisig_address:
-                        continue
-                    if contract_address:
-                        output_evm_address = contract_address
-                        # TODO check make_contract_multisig_address correct
-                    else:
-                        output_evm_address = wallet_address_to_evm(output_address)
-                    account = None
-                    if output_evm_address in content['accounts']:
-                        account = content['accounts'][output_evm_address]
-                    if not account:
-                        response = {'error': 'Address not found'}
-                        return JsonResponse(response, status=httplib.NOT_FOUND)
-                    amount = account['balance'].get(str(output_color))
-                    if not amount:
-                        response = {'error': 'insufficient funds'}
-                        return JsonResponse(response, status=httplib.BAD_REQUEST)
-                    if int(amount) < int(output_value):
-                        response = {'error': 'insufficient funds'}
-                        return JsonResponse(response, status=httplib.BAD_REQUEST)
+            content = state_cache.get(state_multisig_address)
+            for vout in decoded_tx['outs']:
+                output_address = addressFromScriptPubKey(vout['script'])
+                output_color = vout['color']
+                # convert to diqi
+                output_value = vout['value'] / 100000000
+                if output_address == state_multisig_address:
+                    continue
+                if contract_address:
+                    output_evm_address = contract_address
+                    # TODO check make_contract_multisig_address correct
+                else:
+                    output_evm_address = wallet_address_to_evm(output_address)
+                account = None
+                if output_evm_address in content['accounts']:
+                    account = content['accounts'][output_evm_address]
+                if not account:
+                    response = {'error': 'Address not found'}
+                    return JsonResponse(response, status=httplib.NOT_FOUND)
+                amount = account['balance'].get(str(output_color))
+                if not amount:
+                    response = {'error': 'insufficient funds'}
+                    return JsonResponse(response, status=httplib.BAD_REQUEST)
+                if int(amount) < int(output_value):
+                    response = {'error': 'insufficient funds'}
+                    return JsonResponse(response, status=httplib.BAD_REQUEST)
         except IOError:
             response = {'error': 'contract not found'}
             return JsonResponse(response, status=httplib.INTERNAL_SERVER_ERROR)
 
-        # signature = connection.signrawtransaction(tx)
-        p = Proposal.objects.get(multisig_address=state_multisig_address)
-        private_key = Keystore.objects.get(public_key=p.public_key).private_key
+        return None
 
-        signature = multisign(tx, input_index, script, private_key)
-        # return only signature hex
-        response = {'signature': signature}
+    def get_oldest_utxo(self, multisig_address, refresh=False):
+        return utxo_utils.get_state_utxos(multisig_address, refresh=refresh)
 
-        return JsonResponse(response, status=httplib.OK)
+    def spends_oldest_utxo(self, decoded_tx, old_utxo, all_utxos):
+        vins = [(vin['outpoint']['hash'], vin['outpoint']['index']) for vin in decoded_tx['ins']]
+        return old_utxo in vins and all(vin in all_utxos for vin in vins)
 
-    def form_invalid(self, form):
-        response = {'error': form.errors}
 
-        return JsonResponse(response, status=httplib.BAD_REQUEST)
+class BatchSign(Sign):
+    """
+    Sign several inputs of one tx, validating the tx only once.
+    """
+    form_class = BatchSignForm
+
+    def form_valid(self, form):
+        tx = form.cleaned_data['raw_tx']
+        inputs = form.cleaned_data['inputs']
+        state_multisig_address = form.cleaned_data['state_multisig_address']
+        contract_address = form.cleaned_data['contract_address'] or None
+
+        decoded_tx = deserialize(tx)
+        for input_index, _ in inputs:
+            if not 0 <= input_index < len(decoded_tx['ins']):
+                response = {'error': 'input_index {} out of range'.format(input_index)}
+                return JsonResponse(response, status=httplib.BAD_REQUEST)
+
+        error_response = self.validate_tx(decoded_tx, state_multisig_address, contract_address)
+        if error_response:
+            return error_response
+
+        try:
+            signed = self.sign_inputs(tx, inputs, state_multisig_address)
+        except SigningTimeout:
+            response = {'error': 'Signing timed out'}
+            return JsonResponse(response, status=httplib.SERVICE_UNAVAILABLE)
+        signatures = [
+            {'input_index': input_index, 'signature': signature}
+            for (input_index, _), signature in zip(inputs, signed)
+        ]
+        response = {'signatures': signatures}
+        return JsonResponse(response, status=httplib.OK)
 
-    def get_oldest_utxo(self, multisig_address):
-        utxos = gcoincore.get_address_utxos(multisig_address)
-        block_time = None
-        old_utxo = None
-        all_utxos = []
-        for utxo in utxos:
-            all_utxos.append((utxo['txid'], utxo['vout']))
-            raw_tx = gcoincore.get_tx(utxo['txid'])
-            try:
-                block = gcoincore.get_block_by_hash(raw_tx['blockhash'])
-                if block_time is None or int(block['time']) < block_time:
-                    old_utxo = utxo
-                    block_time = int(block['time'])
-            except Exception:
-                print('unconfirmed')
-
-        old_utxo = (old_utxo['txid'], old_utxo['vout'])
-        return old_utxo, all_utxos
+
+def balance_data(multisig_address, address):
+    user_evm_address = wallet_address_to_evm(address)
+    try:
+        content = state_cache.get(multisig_address)
+        account = content['accounts'][user_evm_address]
+        amount = account['balance']
+        response = amount
+        return response, httplib.OK
+    except Exception:
+        response = {}
+        return response, httplib.OK
 
 
 class GetBalance(ProcessFormView):
     http_method_name = ['get']
 
     def get(self, request, multisig_address, address):
-        user_evm_address = wallet_address_to_evm(address)
+        response, status = balance_data(multisig_address, address)
+        return JsonResponse(response, status=status)
+
+
+class GetBalances(CsrfExemptMixin, BaseFormView):
+    """
+    Get balances of many addresses from one state file.
+
+    Addresses without an account in the state are listed in `not_found`.
+    """
+    http_method_name = ['post']
+    form_class = BatchBalanceForm
+
+    def form_valid(self, form):
+        multisig_address = self.kwargs['multisig_address']
         try:
-            with open(EVM_PATH.format(multisig_address=multisig_address), 'r') as f:
-                content = json.load(f)
-                account = content['accounts'][user_evm_address]
-                amount = account['balance']
-                response = amount
-                return JsonResponse(response, status=httplib.OK)
-        except Exception:
-            response = {}
-            return JsonResponse(response, status=httplib.OK)
+            content = state_cache.get(multisig_address)
+        except IOError:
+            return response_utils.error_response(httplib.NOT_FOUND, 'contract not found')
+        accounts = content['accounts']
+
+        evm_addresses = [(address, wallet_address_to_evm(address))
+                         for address in form.cleaned_data['addresses']]
+        evm_addresses += [(address, address) for address in form.cleaned_data['evm_addresses']]
+
+        balances = {}
+        not_found = []
+        for address, evm_address in evm_addresses:
+            account = accounts.get(evm_address)
+            if account is None:
+                not_found.append(address)
+            else:
+                balances[address] = account['balance']
+
+        response = {
+            'balances': balances,
+            'not_found': not_found,
+        }
+        return JsonResponse(response, status=httplib.OK)
+
+    def form_invalid(self, form):
+        response = {'error': form.errors}
+        return response_utils.error_response(httplib.BAD_REQUEST, response)
+
+
+class GetHoldings(View):
+    """
+    Get balances of one wallet address across every state file.
+    """
+    http_method_name = ['get']
+
+    def get(self, request, address):
+        evm_address = wallet_address_to_evm(address)
+        response = {'holdings': holdings.get_holdings(evm_address)}
+        return JsonResponse(response, status=httplib.OK)
+
+
+def page_storage(storage, sorted_keys, prefix='', start='', end='', cursor='', limit=100):
+    """
+    Return one page of `storage` in sorted key order and the cursor of the
+    next page, or None when this is the last page.
+
+    `start` is inclusive, `end` is exclusive and `cursor` is the last key of
+    the previous page, so a cursor stays valid when slots are added or
+    removed between calls.
+    """
+    low = bisect.bisect_left(sorted_keys, max(start, prefix))
+    if cursor:
+        low = max(low, bisect.bisect_right(sorted_keys, cursor))
+    high = bisect.bisect_left(sorted_keys, end) if end else len(sorted_keys)
+
+    page = []
+    index = low
+    while index < high and len(page) < limit and sorted_keys[index].startswith(prefix):
+        page.append(sorted_keys[index])
+        index += 1
+
+    has_more = index < high and sorted_keys[index].startswith(prefix)
+    next_cursor = page[-1] if page and has_more else None
+    return {key: storage[key] for key in page}, next_cursor
+
+
+def storage_data(multisig_address, query):
+    contract_evm_address = wallet_address_to_evm(multisig_address)
+    form = StorageQueryForm(query)
+    if not form.is_valid():
+        return response_utils.error_data(httplib.BAD_REQUEST, form.errors)
+
+    try:
+        content = state_cache.get(multisig_address)
+        account = content['accounts'][contract_evm_address]
+        storage = account['storage']
+    except Exception:
+        response = {}
+        return response, httplib.OK
+
+    if not form.is_paginated():
+        response = storage
+        return response, httplib.OK
+
+    keys = form.cleaned_data['keys']
+    if keys:
+        response = {
+            'storage': {key: storage[key] for key in keys if key in storage},
+            'not_found': [key for key in keys if key not in storage],
+        }
+        return response, httplib.OK
+
+    sorted_keys = state_cache.get_derived(
+        multisig_address, ('storage_keys', contract_evm_address),
+        lambda content: sorted(content['accounts'][contract_evm_address]['storage']))
+    page, next_cursor = page_storage(
+        storage, sorted_keys,
+        prefix=form.cleaned_data['prefix'],
+        start=form.cleaned_data['start'],
+        end=form.cleaned_data['end'],
+        cursor=form.cleaned_data['cursor'],
+        limit=form.cleaned_data['limit'])
+    response = {
+        'storage': page,
+        'next_cursor': next_cursor,
+    }
+    return response, httplib.OK
 
 
 class GetStorage(View):
+    """
+    Get storage of a contract.
+
+    Without query parameters the whole storage map is returned. `keys`
+    (comma separated) looks up individual slots; `prefix`, `start`, `end`,
+    `cursor` and `limit` page through the slots in sorted key order.
+    """
 
     def get(self, request, multisig_address):
-        contract_evm_address = wallet_address_to_evm(multisig_address)
-        try:
-            with open(EVM_PATH.format(multisig_address=multisig_address), 'r') as f:
-                content = json.load(f)
-                account = content['accounts'][contract_evm_address]
-                storage = account['storage']
-                response = storage
-                return JsonResponse(response, status=httplib.OK)
-        except Exception:
-            response = {}
-            return JsonResponse(response, status=httplib.OK)
+        response, status = storage_data(multisig_address, request.GET)
+        return JsonResponse(response, status=status)
 
 
 class DumpContractState(View):
     """
     Get contract state file
+
+    The file is streamed as stored on disk instead of being parsed and
+    re-serialised, with gzip and ETag/Last-Modified revalidation.
     """
 
     def get(self, request, multisig_address):
         try:
-            with open(EVM_PATH.format(multisig_address=multisig_address), 'r') as f:
-                content = json.load(f)
-                response = content
-                return JsonResponse(response, status=httplib.OK)
-        except Exception:
+            state_file = open(state_path(multisig_address), 'rb')
+        except IOError:
             response = {}
             return JsonResponse(response, status=httplib.OK)
+        return response_utils.file_response(request, state_file, 'application/json')
 
 
 class CheckContractCode(View):
@@ -307,30 +632,52 @@ class CheckContractCode(View):
     def get(self, request, multisig_address):
         contract_evm_address = wallet_address_to_evm(multisig_address)
         try:
-            with open(EVM_PATH.format(multisig_address=multisig_address), 'r') as f:
-                content = json.load(f)
-                account = content['accounts'][contract_evm_address]
-                code = account['code']
-                response = {'code': code}
-                return JsonResponse(response, status=httplib.OK)
+            content = state_cache.get(multisig_address)
+            account = content['accounts'][contract_evm_address]
+            code = account['code']
+            response = {'code': code}
+            return JsonResponse(response, status=httplib.OK)
         except Exception:
             response = {'status': 'Contract code not found'}
             return JsonResponse(response, status=status.HTTP_400_BAD_REQUEST)
 
 
+def tx_notified_data(tx_hash):
+    response = {
+        "message": 'Received notify with tx_hash ' + tx_hash
+    }
+    print('Received notify with tx_hash ' + tx_hash)
+
+    error = queue_notification(NotificationJob.KIND_TX, tx_hash)
+    if error:
+        return error
+    return response, httplib.OK
+
+
+def address_notified_data(multisig_address, data):
+    form = NotifyForm(data)
+    tx_hash = ""
+
+    if form.is_valid():
+        tx_hash = form.cleaned_data['tx_hash']
+    else:
+        return response_utils.error_data(httplib.NOT_ACCEPTABLE, form.errors)
+
+    response = {"message": 'Received notify with address {}, tx_hash {}'.format(multisig_address, tx_hash)}
+    print('Received notify with address ' + multisig_address + ', tx_hash ' + tx_hash)
+    error = queue_notification(NotificationJob.KIND_ADDRESS, tx_hash, multisig_address)
+    if error:
+        return error
+    return response, httplib.OK
+
+
 class NewTxNotified(CsrfExemptMixin, ProcessFormView):
     http_method_name = ['post']
 
     def post(self, request, *args, **kwargs):
         tx_hash = self.kwargs['tx_hash']
-        response = {
-            "message": 'Received notify with tx_hash ' + tx_hash
-        }
-        print('Received notify with tx_hash ' + tx_hash)
-
-        t = threading.Thread(target=evm_deploy, args=[tx_hash, ])
-        t.start()
-        return JsonResponse(response, status=httplib.OK)
+        response, status = tx_notified_data(tx_hash)
+        return JsonResponse(response, status=status)
 
 
 class AddressNotified(View):
@@ -348,20 +695,8 @@ class AddressNotified(View):
             status: State-Update is failed or completed
         """
         multisig_address = self.kwargs['multisig_address']
-        form = NotifyForm(request.POST)
-        tx_hash = ""
-
-        if form.is_valid():
-            tx_hash = form.cleaned_data['tx_hash']
-        else:
-            return response_utils.error_response(httplib.NOT_ACCEPTABLE, form.errors)
-
-        response = {"message": 'Received notify with address ' +
-                    multisig_address + ', tx_hash ' + tx_hash}
-        print('Received notify with address ' + multisig_address + ', tx_hash ' + tx_hash)
-        t = threading.Thread(target=evm_deploy, args=[tx_hash, ])
-        t.start()
-        return JsonResponse(response, status=httplib.OK)
+        response, status = address_notified_data(multisig_address, request.POST)
+        return JsonResponse(response, status=status)
 
 
 class OraclizeContractInterface(View):
@@ -375,3 +710,29 @@ class OraclizeContractInterface(View):
             'interface': obj.interface,
         }
         return JsonResponse(response, status=httplib.OK)
+
+
+class Metrics(View):
+    """
+    Report in-process cache and queue counters.
+    """
+    http_method_name = ['get']
+
+    def get(self, request):
+        response = {
+            'state_cache': state_cache.stats(),
+            'chain_cache': gcoincore.get_chain_cache().stats(),
+            'signature_cache': signature_cache.stats(),
+            'state_sync': state_sync.stats(),
+            'notifications': get_dispatcher().stats(),
+        }
+        signing_pool = get_signing_pool()
+        if signing_pool is not None:
+            response['signing_pool'] = signing_pool.stats()
+        evm_pool = get_evm_pool()
+        if evm_pool is not None:
+            response['evm_pool'] = evm_pool.stats()
+        evm_executor = get_evm_executor()
+        if hasattr(evm_executor, 'stats'):
+            response['evm_executor'] = evm_executor.stats()
+        return JsonResponse(response, status=httplib.OK)
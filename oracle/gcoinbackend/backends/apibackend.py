@@ -2,10 +2,10 @@ import decimal
 
 from django.conf import settings
 
-from gcoin import signall
 from gcoinapi.client import GcoinAPIClient
 from gcoinapi.error import GcoinAPIError, InvalidParameterError, NotFoundError
 from gcoinbackend import exceptions
+from gcoinbackend.signers import get_signer
 
 from .base import BaseGcoinBackend
 
@@ -52,7 +52,7 @@ class GcoinAPIBackend(BaseGcoinBackend):
             license_info=license_info
         )
         privkey = self.key_store.get_privkey(alliance_member_address)
-        signed_tx = signall(str(raw_tx), privkey)
+        signed_tx = get_signer().signall(str(raw_tx), privkey)
         tx_hash = self.client.send_license_tx(signed_tx)
         return tx_hash
 
@@ -70,7 +70,7 @@ class GcoinAPIBackend(BaseGcoinBackend):
             color_id=color_id
         )
         privkey = self.key_store.get_privkey(mint_address)
-        signed_tx = signall(str(raw_tx), privkey)
+        signed_tx = get_signer().signall(str(raw_tx), privkey)
         tx_hash = self.client.send_mint_tx(signed_tx)
         return tx_hash
 
@@ -104,7 +104,7 @@ class GcoinAPIBackend(BaseGcoinBackend):
         privkey = self.key_store.get_privkey(from_address)
 
         # raw_tx is unicode need to tranform to str
-        signed_tx = signall(str(raw_tx), privkey)
+        signed_tx = get_signer().signall(str(raw_tx), privkey)
 
         tx_hash = self.client.send_tx(signed_tx)
         return tx_hash
@@ -157,6 +157,6 @@ class GcoinAPIBackend(BaseGcoinBackend):
 
     def send_contract_tx(self, from_address, raw_tx):
         privkey = self.key_store.get_privkey(from_address)
-        signed_tx = signall(str(raw_tx), privkey)
+        signed_tx = get_signer().signall(str(raw_tx), privkey)
         tx_hash = self.client.send_tx(signed_tx)
         return tx_hash
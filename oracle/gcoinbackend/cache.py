@@ -0,0 +1,95 @@
+"""
+Read-through cache of immutable chain data.
+
+Confirmed transactions and block headers never change, so they are kept
+forever in a local sqlite file that survives restarts, with an in-memory LRU
+in front of it. Values are stored as JSON so callers always get their own copy.
+"""
+import collections
+import json
+import sqlite3
+import threading
+
+
+class ChainCache(object):
+
+    def __init__(self, path=None, memory_entries=10000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def get(self, kind, key):
+        with self._lock:
+            value = self._memory.get((kind, key))
+            if value is not None:
+                self._memory.move_to_end((kind, key))
+                self.memory_hits += 1
+                return json.loads(value)
+
+        value = self._get_from_disk(kind, key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(kind, key, value)
+        return json.loads(value)
+
+    def set(self, kind, key, obj):
+        value = json.dumps(obj)
+        with self._lock:
+            self._remember(kind, key, value)
+        self._set_on_disk(kind, key, value)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': float(hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+            }
+
+    def _remember(self, kind, key, value):
+        self._memory[(kind, key)] = value
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('CREATE TABLE IF NOT EXISTS chain_cache '
+                               '(kind TEXT, key TEXT, value TEXT, PRIMARY KEY (kind, key))')
+            self._local.connection = connection
+        return connection
+
+    def _get_from_disk(self, kind, key):
+        if not self.path:
+            return None
+        try:
+            row = self._get_connection().execute(
+                'SELECT value FROM chain_cache WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        except sqlite3.Error as e:
+            print('Chain cache read failed: ' + str(e))
+            return None
+        return row[0] if row else None
+
+    def _set_on_disk(self, kind, key, value):
+        if not self.path:
+            return
+        try:
+            with self._get_connection() as connection:
+                connection.execute('INSERT OR REPLACE INTO chain_cache (kind, key, value) VALUES (?, ?, ?)',
+                                   (kind, key, value))
+        except sqlite3.Error as e:
+            # the cache is only an optimisation, OSS stays the source of truth
+            print('Chain cache write failed: ' + str(e))
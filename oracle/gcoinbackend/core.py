@@ -2,11 +2,20 @@
 """
 Functions for interacting with Gcoin
 """
+import threading
+
 from django.conf import settings
 from django.utils.module_loading import import_string
 
+from .cache import ChainCache
+
 
 _backend = None
+_chain_cache = None
+_chain_cache_lock = threading.Lock()
+
+# the fields of a block which never change once it is confirmed
+BLOCK_HEADER_FIELDS = ('hash', 'height', 'time', 'previousblockhash')
 
 
 def get_gcoin_backend():
@@ -19,6 +28,22 @@ def get_gcoin_backend():
     return _backend
 
 
+def get_chain_cache():
+    global _chain_cache
+    with _chain_cache_lock:
+        if not _chain_cache:
+            _chain_cache = ChainCache(
+                path=getattr(settings, 'GCOIN_CACHE_PATH', None),
+                memory_entries=getattr(settings, 'GCOIN_CACHE_MEMORY_ENTRIES', 10000))
+    return _chain_cache
+
+
+def _is_confirmed(obj):
+    # a result without a confirmation count is treated as unconfirmed
+    min_confirmations = getattr(settings, 'GCOIN_CACHE_MIN_CONFIRMATIONS', 1)
+    return obj.get('confirmations', 0) >= min_confirmations
+
+
 def get_address_balance(address, color_id=None, min_conf=0):
     backend = get_gcoin_backend()
     return backend.get_address_balance(address, color_id, min_conf)
@@ -55,8 +80,18 @@ def send(from_address, to_address, amount, color_id):
 
 
 def get_tx(tx_hash):
-    backend = get_gcoin_backend()
-    return backend.get_tx(tx_hash)
+    """
+    Confirmed transactions are served from the chain cache; their
+    `confirmations` is the count at the time they were first cached.
+    """
+    cache = get_chain_cache()
+    tx = cache.get('tx', tx_hash)
+    if tx is None:
+        backend = get_gcoin_backend()
+        tx = backend.get_tx(tx_hash)
+        if tx.get('blockhash') and _is_confirmed(tx):
+            cache.set('tx', tx_hash, tx)
+    return tx
 
 
 def get_txs_by_address(address, starting_after=None, since=None, tx_type=None):
@@ -65,8 +100,31 @@ def get_txs_by_address(address, starting_after=None, since=None, tx_type=None):
 
 
 def get_block_by_hash(block_hash):
+    """
+    Fetch the whole block; the header of a confirmed block is cached for
+    `get_block_header`.
+    """
     backend = get_gcoin_backend()
-    return backend.get_block_by_hash(block_hash)
+    block = backend.get_block_by_hash(block_hash)
+    if _is_confirmed(block):
+        get_chain_cache().set('block', block_hash, _block_header(block))
+    return block
+
+
+def get_block_header(block_hash):
+    """
+    Return the hash, height, time and previousblockhash of a block, served
+    from the chain cache once the block is confirmed.
+    """
+    cache = get_chain_cache()
+    header = cache.get('block', block_hash)
+    if header is None:
+        header = _block_header(get_block_by_hash(block_hash))
+    return header
+
+
+def _block_header(block):
+    return dict((field, block[field]) for field in BLOCK_HEADER_FIELDS if field in block)
 
 
 def get_latest_blocks():
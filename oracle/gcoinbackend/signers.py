@@ -0,0 +1,121 @@
+"""
+Signer backends for gcoin transactions.
+
+A signer only implements the ECDSA primitive (`load_key` and `sign_hash`);
+building the signature hash and the scriptSig is shared, so every backend
+produces byte-identical signatures. Nonces are derived with RFC 6979 and
+`s` is normalised to the lower half of the curve order, which is what
+libsecp256k1 does.
+
+The backend is chosen with the `GCOIN_SIGNER` setting.
+"""
+import binascii
+import re
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from gcoin import (G, N, SIGHASH_ALL, bin_txhash, decode_privkey, der_encode_sig,
+                   deserialize, deterministic_generate_k, encode, encode_privkey,
+                   fast_multiply, hash_to_int, inv, privkey_to_pubkey, serialize,
+                   serialize_script, signature_form)
+
+_signer = None
+
+
+def get_signer():
+    global _signer
+    if not _signer:
+        path = getattr(settings, 'GCOIN_SIGNER', 'gcoinbackend.signers.GcoinSigner')
+        klass = import_string(path)
+        _signer = klass()
+    return _signer
+
+
+class BaseSigner(object):
+
+    def load_key(self, private_key):
+        """
+        Decode a private key into the form `sign_hash` expects.
+        """
+        raise NotImplementedError
+
+    def sign_hash(self, msghash, key):
+        """
+        Return the hex DER signature of a 32 byte hash.
+        """
+        raise NotImplementedError
+
+    def ecdsa_tx_sign(self, tx, key, hashcode=SIGHASH_ALL):
+        return self.sign_hash(bin_txhash(tx, hashcode), key) + encode(hashcode, 16, 2)
+
+    def multisign(self, tx, i, script, key, hashcode=SIGHASH_ALL):
+        """
+        Same as `gcoin.multisign`, `key` is a key returned by `load_key`.
+        """
+        if re.match('^[0-9a-fA-F]*$', tx):
+            tx = binascii.unhexlify(tx)
+        if re.match('^[0-9a-fA-F]*$', script):
+            script = binascii.unhexlify(script)
+        txobj = deserialize(tx)
+        txobj['ins'][i]['script'] = script
+        tx = serialize(txobj)
+        modtx = signature_form(tx, i, hashcode)
+        return self.ecdsa_tx_sign(modtx, key, hashcode)
+
+    def sign(self, tx, i, private_key, hashcode=SIGHASH_ALL):
+        """
+        Same as `gcoin.sign` for hex txs and hex private keys.
+        """
+        i = int(i)
+        pub = privkey_to_pubkey(private_key)
+        signing_tx = signature_form(tx, i, hashcode)
+        sig = self.ecdsa_tx_sign(signing_tx, self.load_key(private_key), hashcode)
+        txobj = deserialize(tx)
+        # Obsolete pay-to-pubkey transaction.
+        if re.match('^21[0-9a-fA-F]{66}ac', txobj['ins'][i]['script']):
+            txobj['ins'][i]['script'] = serialize_script([sig])
+        else:
+            txobj['ins'][i]['script'] = serialize_script([sig, pub])
+        return serialize(txobj)
+
+    def signall(self, tx, private_key):
+        for i in range(len(deserialize(tx)['ins'])):
+            tx = self.sign(tx, i, private_key)
+        return tx
+
+
+class GcoinSigner(BaseSigner):
+    """
+    Pure Python signer built on the gcoin primitives.
+
+    `gcoin.ecdsa_raw_sign` mixes a random nonce into RFC 6979; this signer
+    uses the plain RFC 6979 nonce so signatures are reproducible.
+    """
+
+    def load_key(self, private_key):
+        return decode_privkey(private_key)
+
+    def sign_hash(self, msghash, key):
+        z = hash_to_int(msghash)
+        k = deterministic_generate_k(msghash, key)
+        r, _ = fast_multiply(G, k)
+        s = inv(k, N) * (z + r * decode_privkey(key)) % N
+        if s * 2 >= N:
+            s = N - s
+        return der_encode_sig(None, r, s)
+
+
+class Secp256k1Signer(BaseSigner):
+    """
+    libsecp256k1 signer, requires the `coincurve` package.
+    """
+
+    def __init__(self):
+        from coincurve import PrivateKey
+        self.private_key_class = PrivateKey
+
+    def load_key(self, private_key):
+        return self.private_key_class(encode_privkey(decode_privkey(private_key), 'bin'))
+
+    def sign_hash(self, msghash, key):
+        return binascii.hexlify(key.sign(msghash, hasher=None)).decode('ascii')
@@ -0,0 +1,143 @@
+"""
+ASGI config for oracle project.
+
+It exposes an ASGI 3 callable as a module-level variable named
+``application``, served with any ASGI server, e.g.
+
+    uvicorn oracle.asgi:application
+
+Requests are read and answered on the event loop and only handed to the
+Django WSGI application, with its URLs and middleware, on a bounded thread
+pool, so one process keeps many slow clients open without a thread each.
+Request bodies above `ASGI_MAX_BODY_SIZE` are refused and an error escaping
+the application is answered with a JSON 500 like the views do.
+"""
+import asyncio
+import concurrent.futures
+import io
+import json
+import sys
+import traceback
+
+# sets up Django, preloads the keyring and forks the worker pools
+from oracle.wsgi import application as wsgi_application
+
+from django.conf import settings  # noqa
+
+from app.response_utils import error_data  # noqa
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=getattr(settings, 'ASGI_EXECUTOR_WORKERS', 32))
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, max_size):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > max_size:
+            raise BodyTooLarge('Request body exceeds {} bytes'.format(max_size))
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_error(send, http_code, message):
+    response, status = error_data(http_code, message)
+    await send_response(send, status, [(b'content-type', b'application/json')],
+                        json.dumps(response).encode('utf-8'))
+
+
+def wsgi_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = 'HTTP_' + name
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def run_wsgi(scope, body):
+    """
+    Run the Django WSGI application and return (status, headers, body).
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                              for name, value in headers]
+
+    result = wsgi_application(wsgi_environ(scope, body), start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers'], content
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    try:
+        body = await read_body(receive, getattr(settings, 'ASGI_MAX_BODY_SIZE', 2621440))
+    except BodyTooLarge as e:
+        await send_error(send, httplib.REQUEST_ENTITY_TOO_LARGE, str(e))
+        return
+
+    loop = asyncio.get_event_loop()
+    try:
+        status, headers, content = await loop.run_in_executor(executor, run_wsgi, scope, body)
+    except Exception as e:
+        traceback.print_exc()
+        await send_error(send, httplib.INTERNAL_SERVER_ERROR, str(e))
+        return
+    await send_response(send, status, headers, content)
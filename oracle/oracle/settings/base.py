@@ -31,6 +31,64 @@ OSS_API_URL = env("OSS_API_URL")
 ORACLE_API_URL = env("ORACLE_API_URL")
 CONFIRMATION = env("CONFIRMATION")
 
+# byte budget of the in-process cache of parsed contract state files
+STATE_CACHE_MAX_BYTES = env.int("STATE_CACHE_MAX_BYTES", default=256 * 1024 * 1024)
+
+# upper bound of addresses per batch balance request
+BATCH_BALANCE_MAX_ADDRESSES = env.int("BATCH_BALANCE_MAX_ADDRESSES", default=5000)
+
+# upper bound of storage slots per page of the storage api
+STORAGE_PAGE_MAX_SIZE = env.int("STORAGE_PAGE_MAX_SIZE", default=1000)
+
+# concurrent OSS lookups and overall deadline (seconds) when resolving utxo ages
+UTXO_LOOKUP_CONCURRENCY = env.int("UTXO_LOOKUP_CONCURRENCY", default=16)
+UTXO_LOOKUP_TIMEOUT = env.float("UTXO_LOOKUP_TIMEOUT", default=15)
+
+# number of signatures kept for idempotent Sign retries
+SIGNATURE_CACHE_MAX_ENTRIES = env.int("SIGNATURE_CACHE_MAX_ENTRIES", default=10000)
+
+# signing worker processes (0 signs in the request thread) and their reply deadline (seconds)
+SIGNING_WORKERS = env.int("SIGNING_WORKERS", default=0)
+SIGNING_TIMEOUT = env.float("SIGNING_TIMEOUT", default=10)
+
+# seconds Sign waits for the state synchroniser before answering 503
+STATE_SYNC_WAIT_TIMEOUT = env.float("STATE_SYNC_WAIT_TIMEOUT", default=5)
+
+# notification worker threads, max queued notifications and seconds to drain them on shutdown
+NOTIFICATION_WORKERS = env.int("NOTIFICATION_WORKERS", default=4)
+NOTIFICATION_QUEUE_LIMIT = env.int("NOTIFICATION_QUEUE_LIMIT", default=1000)
+NOTIFICATION_DRAIN_TIMEOUT = env.float("NOTIFICATION_DRAIN_TIMEOUT", default=30)
+
+# run notification jobs and state advances in the calling thread, e.g. in tests
+RUN_BACKGROUND_TASKS_INLINE = env.bool("RUN_BACKGROUND_TASKS_INLINE", default=False)
+
+# 'memory' processes notifications in the web process, 'database' queues them
+# for `manage.py run_notification_worker`
+NOTIFICATION_QUEUE = env("NOTIFICATION_QUEUE", default='memory')
+JOB_MAX_ATTEMPTS = env.int("JOB_MAX_ATTEMPTS", default=10)
+JOB_RETRY_BASE_DELAY = env.float("JOB_RETRY_BASE_DELAY", default=5)
+JOB_RETRY_MAX_DELAY = env.float("JOB_RETRY_MAX_DELAY", default=3600)
+JOB_LEASE_TIMEOUT = env.int("JOB_LEASE_TIMEOUT", default=600)
+
+# EVM worker processes (0 updates states in the calling thread) and their reply deadline (seconds)
+EVM_WORKERS = env.int("EVM_WORKERS", default=0)
+EVM_WORKER_TIMEOUT = env.float("EVM_WORKER_TIMEOUT", default=600)
+
+# oraclize calls spawn `evm` per call, or use 'app.oraclize.PersistentExecutor' with the
+# command of a long-lived EVM server; seconds before restarting a server which could not
+# start and seconds the server has to answer a request
+EVM_EXECUTOR = env("EVM_EXECUTOR", default='app.oraclize.SubprocessExecutor')
+EVM_SERVER_COMMAND = env("EVM_SERVER_COMMAND", default='')
+EVM_SERVER_RETRY_DELAY = env.float("EVM_SERVER_RETRY_DELAY", default=30)
+EVM_SERVER_TIMEOUT = env.float("EVM_SERVER_TIMEOUT", default=60)
+
+# seconds `run_oraclize_feeds` waits for a value source URL
+ORACLIZE_FEED_TIMEOUT = env.float("ORACLIZE_FEED_TIMEOUT", default=10)
+
+# threads running the requests served by oracle.asgi and the largest request body it accepts (bytes)
+ASGI_EXECUTOR_WORKERS = env.int("ASGI_EXECUTOR_WORKERS", default=32)
+ASGI_MAX_BODY_SIZE = env.int("ASGI_MAX_BODY_SIZE", default=2621440)
+
 DATABASES = {
     "default": {
         "NAME": env("ORACLE_DB"),
@@ -68,6 +126,14 @@ GCOIN_BACKEND_SETTINGS = {
     'KEY_STORE_CLASS': 'wallet.keystore.KeyStore'
 }
 
+# permanent cache of confirmed txs and blocks fetched from OSS
+GCOIN_CACHE_PATH = env("GCOIN_CACHE_PATH", default=os.path.join(BASE_DIR, '..', 'chain_cache.sqlite3'))
+GCOIN_CACHE_MEMORY_ENTRIES = env.int("GCOIN_CACHE_MEMORY_ENTRIES", default=10000)
+GCOIN_CACHE_MIN_CONFIRMATIONS = env.int("GCOIN_CACHE_MIN_CONFIRMATIONS", default=1)
+
+# signer backend, 'gcoinbackend.signers.Secp256k1Signer' signs with libsecp256k1 through coincurve
+GCOIN_SIGNER = env("GCOIN_SIGNER", default='gcoinbackend.signers.GcoinSigner')
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -14,3 +14,19 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "oracle.settings")
 
 application = get_wsgi_application()
+
+# load the signing keys before the first sign request
+from django.db import DatabaseError  # noqa
+
+from app.keyring import keyring  # noqa
+from app.evm_pool import get_evm_pool  # noqa
+from app.signing_pool import get_signing_pool  # noqa
+
+try:
+    keyring.load()
+except DatabaseError as e:
+    print('Cannot preload keyring: ' + str(e))
+
+# fork the signing workers now so they inherit the loaded keys
+get_signing_pool()
+get_evm_pool()